@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import hashlib
+import inspect
+import pandas as pd
+
+ARTIFACT_DIR = "data/artifacts"
+
+
+def frame_hash(df):
+    digest = hashlib.sha256(json.dumps([list(map(str, df.columns)), list(map(str, df.dtypes))]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def source_hash(paths):
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+class ArtifactStore:
+    # Each artifact is a Parquet file named after its content hash, recorded in manifest.json together with the
+    # key it was built from: the hashes of its inputs, the source of the function that produced it and the
+    # contents of code_paths, the modules that function may call into.
+    def __init__(self, path=ARTIFACT_DIR, code_paths=()):
+        self.path = path
+        self.code_hash = source_hash(code_paths)
+        os.makedirs(path, exist_ok=True)
+        self.manifest_path = os.path.join(path, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def has(self, name):
+        return name in self.manifest and os.path.exists(os.path.join(self.path, self.manifest[name]["file"]))
+
+    def hash(self, name):
+        if not self.has(name):
+            raise FileNotFoundError(f"No cached artifact {name!r} in {self.path}, run the stage that produces it first")
+        return self.manifest[name]["hash"]
+
+    def load(self, name):
+        self.hash(name)
+        return pd.read_parquet(os.path.join(self.path, self.manifest[name]["file"]))
+
+    def save(self, name, df, key=None):
+        content_hash = frame_hash(df)
+        file_name = f"{name}-{content_hash[:16]}.parquet"
+        if not os.path.exists(os.path.join(self.path, file_name)):
+            df.to_parquet(os.path.join(self.path, file_name + ".tmp"), index=False)
+            os.replace(os.path.join(self.path, file_name + ".tmp"), os.path.join(self.path, file_name))
+        previous = self.manifest.get(name, {}).get("file")
+        self.manifest[name] = {"file": file_name, "hash": content_hash, "key": key}
+        with open(self.manifest_path + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+        if previous and previous != file_name and os.path.exists(os.path.join(self.path, previous)):
+            os.remove(os.path.join(self.path, previous))
+        return content_hash
+
+    def run(self, name, inputs, function, force=False):
+        # Rebuilds the artifact only when an input, the producing function or code_paths changed, unless forced.
+        key = hashlib.sha256(json.dumps([self.code_hash, inspect.getsource(function), [self.hash(input_name) for input_name in inputs]]).encode()).hexdigest()
+        if not force and self.has(name) and self.manifest[name]["key"] == key:
+            print(f"{name}: inputs unchanged, using cached artifact")
+            return self.load(name)
+        result = function(*[self.load(input_name) for input_name in inputs])
+        self.save(name, result, key)
+        return result
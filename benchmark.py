@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sys
+import json
+import zlib
+import argparse
+import platform
+import tempfile
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+import pandas as pd
+from data_update import restaurant_data, stream_restaurant_data, restaurant_table, replace_lat_lon, grade_table, finalize_restaurant, violation_table, VIOLATION_COLUMNS
+from sheets_publisher import publish_frame, FakeWorksheet
+from sinks import VIOLATION_KEY
+from profiling import Profiler
+
+BOROUGHS = ["Manhattan", "Brooklyn", "Queens", "Bronx", "Staten Island"]
+CUISINES = ["American", "Chinese", "Pizza", "Coffee/Tea", "Mexican", "Italian", "Japanese", "Latin American", "Bakery Products/Desserts",
+            "Caribbean", "Spanish", "Donuts", "Chicken", "Hamburgers", "Indian", "Thai", "Korean", "Jewish/Kosher", "Juice, Smoothies, Fruit Salads", "Mediterranean"]
+NAMES = ["JOE'S PIZZA", "GOLDEN DRAGON", "DUNKIN'", "STARBUCKS", "MCDONALD'S", "LA ESQUINA", "SUSHI YASUDA", "KATZ'S DELICATESSEN",
+         "2 BROS PIZZA", "THE HALAL GUYS", "PEKING GARDEN", "EL BASURERO", "CAFE HABANA", "LE BERNARDIN", "NEW YORK BAGEL"]
+STREETS = ["BROADWAY", "WEST 4 STREET", "5 AVENUE", "FLATBUSH AVENUE", "EAST 23RD ST", "QUEENS BOULEVARD", "ATLANTIC AVENUE", "GRAND CONCOURSE",
+           "ST NICHOLAS AVENUE", "ROOSEVELT AVENUE", "BEACH 116 STREET", "FORT HAMILTON PARKWAY", "HYLAN BOULEVARD", "B'WAY", "2 AVENUE"]
+VIOLATIONS = [
+    ("02B", "Hot TCS food item not held at or above 140 °F.", "Critical"),
+    ("02G", "Cold TCS food item held above 41 °F; smoked or processed fish held above 38 °F; intact raw eggs held above 45 °F.", "Critical"),
+    ("04L", "Evidence of mice or live mice in establishment's food or non-food areas.", "Critical"),
+    ("04N", "Filth flies or food/refuse/sewage associated with (FRSA) flies or other nuisance pests in establishment’s food and/or non-food areas.", "Critical"),
+    ("06C", "Food, supplies, or equipment not protected from potential source of contamination during storage, preparation, transportation, display, service or from customer’s refillable, reusable container.", "Critical"),
+    ("06D", "Food contact surface not properly washed, rinsed and sanitized after each use and following any activity when contamination may have occurred.", "Critical"),
+    ("08A", "Establishment is not free of harborage or conditions conducive to rodents, insects or other pests.", "Not Critical"),
+    ("10B", "Anti-siphonage or back-flow prevention device not provided where required; equipment or floor not properly drained; sewage disposal system in disrepair or not functioning properly.", "Not Critical"),
+    ("10F", "Non-food contact surface or equipment made of unacceptable material, not kept clean, or not properly sealed, raised, spaced or movable to allow accessibility for cleaning on all sides, above and underneath the unit.", "Not Critical"),
+    ("09C", "Food contact surface not properly maintained.", "Not Critical"),
+]
+CITED = "Violations were cited in the following area(s)."
+NO_VIOLATIONS = "No violations were recorded at the time of this inspection."
+CLOSED = "Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed."
+RECLOSED = "Establishment re-closed by DOHMH."
+REOPENED = "Establishment re-opened by DOHMH."
+
+
+def permit_history(rng):
+    # Inspection cycles of one permit: an initial inspection, a re-inspection when the initial score is above 13,
+    # and occasionally a closure followed by compliance and re-opening inspections.
+    program = "Cycle Inspection" if rng.random() > 0.15 else "Pre-permit (Operational)"
+    date = pd.Timestamp("2016-01-01") + pd.Timedelta(days=int(rng.integers(0, 2000)))
+    inspections = []
+    for _ in range(1 + rng.geometric(0.45)):
+        score = int(rng.gamma(2.0, 7.0))
+        closed = rng.random() < 0.04
+        action = CLOSED if closed else (NO_VIOLATIONS if score == 0 else CITED)
+        inspections.append((date, f"{program} / Initial Inspection", action, score, "A" if score <= 13 and not closed else None))
+        if closed:
+            date += pd.Timedelta(days=int(rng.integers(1, 10)))
+            if rng.random() < 0.3:
+                inspections.append((date, f"{program} / Compliance Inspection", RECLOSED, int(rng.gamma(2.0, 5.0)), None))
+                date += pd.Timedelta(days=int(rng.integers(1, 10)))
+            inspections.append((date, f"{program} / Reopening Inspection", REOPENED, int(rng.gamma(1.5, 4.0)), rng.choice(["P", "Z", None])))
+        elif score > 13:
+            date += pd.Timedelta(days=int(rng.integers(7, 45)))
+            score = int(rng.gamma(2.0, 7.0))
+            inspections.append((date, f"{program} / Re-inspection", CITED, score, "A" if score <= 13 else "B" if score <= 27 else "C"))
+        date += pd.Timedelta(days=int(rng.integers(90, 400)))
+    return inspections
+
+def synthetic_page(index, page_size=1000, seed=0, row_count=None):
+    # Page index holds permits from index * page_size on, so pages never share a permit. row_count shortens the
+    # last page of a dataset; it gets the first rows of the full page.
+    row_count = page_size if row_count is None else row_count
+    rng = np.random.default_rng([seed, index])
+    rows = []
+    camis = 40000000 + index * page_size
+    while len(rows) < row_count:
+        camis += 1
+        located = rng.random() > 0.03
+        restaurant = {"camis": str(camis), "dba": str(rng.choice(NAMES)), "boro": str(rng.choice(BOROUGHS)), "building": str(rng.integers(1, 3000)),
+                      "street": str(rng.choice(STREETS)), "zipcode": str(rng.integers(10001, 11697)), "phone": str(rng.integers(2000000000, 9999999999)),
+                      "cuisine_description": str(rng.choice(CUISINES)), "latitude": round(float(rng.uniform(40.5, 40.9)), 6) if located else 0,
+                      "longitude": round(float(rng.uniform(-74.2, -73.7)), 6) if located else 0}
+        for date, inspection_type, action, score, grade in permit_history(rng):
+            violations = [VIOLATIONS[i] for i in rng.choice(len(VIOLATIONS), size=min(1 + rng.poisson(1.5), 5), replace=False)] if action != NO_VIOLATIONS else [(None, None, "Not Applicable")]
+            for code, description, critical_flag in violations:
+                rows.append({**restaurant, "__id": f"row-{index}-{len(rows)}", "inspection_date": date.strftime("%Y-%m-%dT00:00:00.000"),
+                             "action": action, "violation_code": code, "violation_description": description, "critical_flag": critical_flag,
+                             "score": score, "grade": grade, "grade_date": date.strftime("%Y-%m-%dT00:00:00.000") if grade else None,
+                             "record_date": "2024-01-01T00:00:00.000", "inspection_type": inspection_type, "location_point1": None})
+    return rows[:row_count]
+
+def write_pages(directory, rows, page_size, seed):
+    for index in range((rows + page_size - 1) // page_size):
+        with open(os.path.join(directory, f"page_{index}.json"), "w") as f:
+            json.dump(synthetic_page(index, page_size, seed, min(page_size, rows - index * page_size)), f)
+
+def serve_pages(directory, rows, page_size):
+    # Local OData stand-in serving the pre-generated pages by $skip, reporting @odata.count and @odata.nextLink.
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+            skip = int(query.get("$skip", 0))
+            with open(os.path.join(directory, f"page_{skip // page_size}.json")) as f:
+                body = {"value": json.load(f)}
+            if query.get("$count") == "true":
+                body["@odata.count"] = rows
+            if skip + page_size < rows:
+                body["@odata.nextLink"] = f"http://127.0.0.1:{server.server_port}/?$skip={skip + page_size}"
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/"
+
+class StubGeocoder:
+    class Location:
+        def __init__(self, latitude, longitude):
+            self.latitude = latitude
+            self.longitude = longitude
+
+    def geocode(self, query):
+        checksum = zlib.crc32(query.encode())
+        return self.Location(40.5 + (checksum % 4000) / 10000, -74.2 + (checksum // 4000 % 5000) / 10000)
+
+def run_benchmark(rows, page_size=1000, seed=0, workers=8, stream=False):
+    profiler = Profiler()
+    with tempfile.TemporaryDirectory() as directory:
+        write_pages(directory, rows, page_size, seed)
+        server, url = serve_pages(directory, rows, page_size)
+        snapshot_path = os.path.join(directory, "snapshot.parquet")
+        with profiler.stage("fetch"):
+            if stream:
+                inspections = stream_restaurant_data(url, workers, os.path.join(directory, "checkpoints"), snapshot_path)
+            else:
+                inspections = restaurant_data(url, workers, os.path.join(directory, "checkpoints"), snapshot_path, full_refresh=True)
+        server.shutdown()
+        with profiler.stage("clean"):
+            restaurant = restaurant_table(inspections)
+        with profiler.stage("geocode", missing=int(restaurant["latitude"].isna().sum())):
+            restaurant = replace_lat_lon(restaurant, os.path.join(directory, "geocode.sqlite"), StubGeocoder(), min_delay_seconds=0)
+        with profiler.stage("grade"):
+            grades = grade_table(inspections)
+        with profiler.stage("normalize"):
+            restaurant = finalize_restaurant(restaurant, grades)
+        violation = violation_table(pd.read_parquet(snapshot_path, columns=VIOLATION_COLUMNS))
+        worksheets = [FakeWorksheet("restaurant"), FakeWorksheet("violation")]
+        for stage in ["publish_full", "publish_unchanged"]:
+            with profiler.stage(stage):
+                publish_frame(worksheets[0], restaurant, ["permit_number"], os.path.join(directory, "published", "restaurant.parquet"))
+                publish_frame(worksheets[1], violation, VIOLATION_KEY, os.path.join(directory, "published", "violation.parquet"))
+    return profiler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the update stages on a synthetic inspection dataset served from a local OData stub.")
+    parser.add_argument("--rows", type=int, default=100000, help="number of inspection rows to generate")
+    parser.add_argument("--page-size", type=int, default=1000, help="rows per OData page")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=8, help="concurrent page fetchers")
+    parser.add_argument("--stream", action="store_true", help="fetch with the streaming ingestion path; publishing still diffs the whole violation table")
+    parser.add_argument("--output", help="write the JSON report to this path instead of stdout")
+    args = parser.parse_args(argv)
+
+    profiler = run_benchmark(args.rows, args.page_size, args.seed, args.workers, args.stream)
+    metadata = {"rows": args.rows, "page_size": args.page_size, "seed": args.seed, "workers": args.workers, "stream": args.stream,
+                "python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__}
+    if args.output:
+        profiler.dump(args.output, **metadata)
+    else:
+        json.dump({**metadata, "stages": profiler.records}, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
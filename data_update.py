@@ -2,323 +2,483 @@
 # coding: utf-8
 
 import os
-import pygsheets
-from google.oauth2 import service_account
+import sys
+import shutil
+import argparse
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
-from geopy.geocoders import ArcGIS
-
-
-def restaurant_data():
-    def nyc_restaurants():
-        url = "https://data.cityofnewyork.us/api/odata/v4/43nn-pn8j"
-        while True:
-            response = requests.get(url)
-            if response.status_code == 200:
-                json_data = response.json()
-                if '@odata.nextLink' in json_data:
-                    url = json_data["@odata.nextLink"]
-                    yield pd.DataFrame(json_data['value'])
-                else:
-                    yield pd.DataFrame(json_data['value'])
-                    break
-                    
-    restaurant_inspection = pd.concat(list(nyc_restaurants()), axis = 0).reset_index(drop = True).drop(columns = ['__id','record_date','location_point1'])
-    restaurant_inspection['inspection_date'] = pd.to_datetime(restaurant_inspection['inspection_date'])
+import pyarrow as pa
+import pyarrow.parquet as pq
+from geocoding import GeocodeCache, geocode_addresses, GEOCODE_CACHE_PATH
+from normalize import map_unique, title_case, street_name, street_address
+from sinks import make_sink, GoogleSheetsSink
+from artifacts import ArtifactStore, ARTIFACT_DIR
+from profiling import Profiler, counted
+
+ODATA_URL = "https://data.cityofnewyork.us/api/odata/v4/43nn-pn8j"
+CHECKPOINT_DIR = "data/odata_pages"
+SNAPSHOT_PATH = "data/restaurant_inspection.parquet"
+DELTA_OVERLAP_DAYS = 30
+FULL_REFRESH_DAYS = 7
+INITIAL_INSPECTION = ['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection']
+RE_INSPECTION = ['Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection']
+REOPENING_INSPECTION = ['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection']
+CLOSED_ACTION = ['Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.','Establishment re-closed by DOHMH.']
+REOPENED_ACTION = 'Establishment re-opened by DOHMH.'
+STAGES = ["fetch", "clean", "geocode", "grade", "audit", "normalize", "publish"]
+CATEGORY_COLUMNS = ["borough", "cuisine_description", "action", "inspection_type", "violation_description", "critical_flag"]
+DATE_COLUMNS = ["inspection_date", "grade_date", "record_date"]
+VIOLATION_COLUMNS = ["permit_number", "inspection_date", "inspection_type", "action", "violation_code", "violation_description", "critical_flag", "score", "grade", "grade_date"]
+RESTAURANT_COLUMNS = ["permit_number", "restaurant_name", "borough", "building", "street", "zipcode", "latitude", "longitude", "phone", "cuisine_description"]
+# Stage functions call into these modules, so a change to any of them rebuilds every cached stage artifact.
+CODE_PATHS = [os.path.join(os.path.dirname(os.path.abspath(__file__)), name) for name in ["data_update.py", "normalize.py", "geocoding.py"]]
+
+
+def odata_session(workers=8, retries=5, backoff=1):
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+@counted
+def odata_get(session, url, params=None, timeout=60):
+    response = session.get(url, params=params, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+def odata_pages(url=ODATA_URL, params=None, workers=8, checkpoint_dir=CHECKPOINT_DIR):
+    # Pages are pulled by $skip/$top offset in parallel and checkpointed to disk, so an interrupted run resumes
+    # from the pages it already has. Servers that do not report @odata.count are walked through @odata.nextLink.
+    params = {**(params or {}), "$orderby": "__id"}
+    # The session is closed when the crawl finishes or the consumer stops iterating early.
+    with odata_session(workers) as session:
+        first = odata_get(session, url, {**params, "$count": "true"})
+        yield pd.DataFrame(first["value"])
+        if "@odata.nextLink" not in first:
+            return
+        if "@odata.count" not in first or not first["value"]:
+            json_data = first
+            while "@odata.nextLink" in json_data:
+                json_data = odata_get(session, json_data["@odata.nextLink"])
+                yield pd.DataFrame(json_data["value"])
+            return
+
+        page_size = len(first["value"])
+        manifest = {"url": url, "params": params, "count": first["@odata.count"], "page_size": page_size}
+        manifest_path = os.path.join(checkpoint_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                if json.load(f) != manifest:
+                    shutil.rmtree(checkpoint_dir)
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f)
+
+        def fetch_page(skip):
+            path = os.path.join(checkpoint_dir, f"page_{skip:010d}.json")
+            if os.path.exists(path):
+                with open(path) as f:
+                    return json.load(f)
+            values = odata_get(session, url, {**params, "$skip": skip, "$top": page_size})["value"]
+            with open(path + ".tmp", "w") as f:
+                json.dump(values, f)
+            os.replace(path + ".tmp", path)
+            return values
+
+        # At most two pages per worker are in flight, so a slow consumer never holds more than that in memory.
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            for skip in range(page_size, manifest["count"], page_size):
+                pending.append(executor.submit(fetch_page, skip))
+                if len(pending) >= 2 * workers:
+                    yield pd.DataFrame(pending.popleft().result())
+            while pending:
+                yield pd.DataFrame(pending.popleft().result())
+
+def apply_schema(restaurant_inspection, report_memory=True):
+    # Repeated text columns become categoricals, score a nullable integer and permit_number an int64, so the
+    # later isin, groupby and merge steps work on compact typed columns instead of Python strings.
+    memory_before = restaurant_inspection.memory_usage(deep=True).sum() if report_memory else 0
+    restaurant_inspection = restaurant_inspection.astype({column: "category" for column in CATEGORY_COLUMNS if column in restaurant_inspection})
+    for column in DATE_COLUMNS:
+        if column in restaurant_inspection:
+            restaurant_inspection[column] = pd.to_datetime(restaurant_inspection[column])
+    for column in ["latitude", "longitude"]:
+        if column in restaurant_inspection:
+            restaurant_inspection[column] = pd.to_numeric(restaurant_inspection[column], errors="coerce").astype(float)
+    restaurant_inspection["score"] = pd.to_numeric(restaurant_inspection["score"], errors="coerce").astype("Int64")
+    restaurant_inspection["permit_number"] = restaurant_inspection["permit_number"].astype("int64")
+    if report_memory:
+        memory_after = restaurant_inspection.memory_usage(deep=True).sum()
+        print(f"Inspection data memory: {memory_before/2**20:.1f} MB -> {memory_after/2**20:.1f} MB")
+    return restaurant_inspection
+
+def clean_inspections(restaurant_inspection, report_memory=True):
+    restaurant_inspection = restaurant_inspection.reset_index(drop = True).drop(columns = ['__id','location_point1'])
     restaurant_inspection = restaurant_inspection.rename(columns = {"camis": "permit_number", "dba": "restaurant_name", "boro": "borough"})
-    restaurant_inspection = restaurant_inspection[restaurant_inspection["inspection_date"]!='1900-01-01T00:00:00.000']
     restaurant_inspection.replace('None', np.nan, inplace=True)
+    restaurant_inspection = apply_schema(restaurant_inspection, report_memory)
+    restaurant_inspection = restaurant_inspection[restaurant_inspection["inspection_date"]!='1900-01-01T00:00:00.000']
     return restaurant_inspection
-                   
-def replace_lat_lon(row):
-    def lat_lon_geocode(address):
-        geolocator_arcgis = ArcGIS()
-        location = geolocator_arcgis.geocode(address)
-        if location!=None:
-            return location.latitude, location.longitude
+
+def last_full_refresh(snapshot_path):
+    state_path = os.path.splitext(snapshot_path)[0] + ".json"
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path) as f:
+        return pd.Timestamp(json.load(f)["full_refresh"])
+
+def record_full_refresh(snapshot_path):
+    state_path = os.path.splitext(snapshot_path)[0] + ".json"
+    with open(state_path + ".tmp", "w") as f:
+        json.dump({"full_refresh": pd.Timestamp.now().isoformat()}, f)
+    os.replace(state_path + ".tmp", state_path)
+
+@counted
+def restaurant_data(url=ODATA_URL, workers=8, checkpoint_dir=CHECKPOINT_DIR, snapshot_path=SNAPSHOT_PATH, full_refresh=False):
+    # Unless a full refresh is requested or the last one is FULL_REFRESH_DAYS old, only rows recorded after the
+    # snapshot's record_date mark or inspected within DELTA_OVERLAP_DAYS of its latest inspection are downloaded.
+    # The overlap picks up inspections that are posted late. Snapshot rows inside the overlap and every
+    # (permit_number, inspection_date) group present in the delta are replaced, so rows removed or corrected
+    # upstream do not linger; older removals are dropped by the periodic full refresh.
+    snapshot, params = None, None
+    last_refresh = last_full_refresh(snapshot_path)
+    if not full_refresh and os.path.exists(snapshot_path):
+        if last_refresh is None or pd.Timestamp.now() - last_refresh >= pd.Timedelta(days=FULL_REFRESH_DAYS):
+            print(f"Last full refresh is older than {FULL_REFRESH_DAYS} days, downloading the whole dataset")
         else:
-            return np.nan, np.nan
-        
-    if pd.isna(row["latitude"]) and pd.isna(row["longitude"]):
-        if pd.isna(row["building"]):
-            address = row["street"] + ", " + row["borough"] + ", NY"
+            snapshot = pd.read_parquet(snapshot_path)
+            inspection_mark = snapshot["inspection_date"].max() - pd.Timedelta(days=DELTA_OVERLAP_DAYS)
+            record_mark = snapshot["record_date"].max()
+            params = {"$filter": f"inspection_date ge {inspection_mark:%Y-%m-%dT%H:%M:%SZ} or record_date gt {record_mark:%Y-%m-%dT%H:%M:%SZ}"}
+    restaurant_inspection = pd.concat(list(odata_pages(url, params, workers, checkpoint_dir)), axis = 0)
+    if snapshot is not None:
+        print(f"Merging {len(restaurant_inspection)} inspection records newer than the snapshot")
+        if restaurant_inspection.empty:
+            restaurant_inspection = snapshot
         else:
-            address = row["building"] + row["street"] + ", " + row["borough"] + ", NY" 
-        geoloc = lat_lon_geocode(address)
-        row["latitude"] = geoloc[0]
-        row["longitude"] = geoloc[1]
-    return row
-
-def reop_inconsistent_count(row):
-    count = 0
-    if pd.notna(row["grade"]):
-        if row["action"]=="Establishment re-opened by DOHMH.":
-            filtered = restaurant_inspection[(restaurant_inspection["permit_number"]==row["permit_number"])&(restaurant_inspection["action"].isin(["Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.","Establishment re-closed by DOHMH."]))].sort_values(by="inspection_date", ascending=False)
-            inspections_when_closed = filtered.groupby(["permit_number","inspection_date"])["inspection_type"].agg(list).reset_index().sort_values(by=["permit_number","inspection_date"], ascending=[True, False])
-            for index in range(len(inspections_when_closed)):
-                inspection_list = inspections_when_closed.iloc[index,:]["inspection_type"]
-                if 'Cycle Inspection / Initial Inspection' in inspection_list or 'Pre-permit (Operational) / Initial Inspection' in inspection_list:
-                    if row["grade"] not in ["P","Z"]:
-                        count += 1
-                    break
-                elif 'Cycle Inspection / Re-inspection' in inspection_list or 'Pre-permit (Operational) / Re-inspection' in inspection_list:
-                        re_inspection_filtered = filtered[filtered["inspection_type"].isin(re_inspection)].iloc[0,:]
-                        if pd.isna(re_inspection_filtered["grade"]):
-                            if re_inspection_filtered["score"] >= 14 and re_inspection_filtered["score"] <=28 and row["grade"] not in ["B","Z"]:
-                                count += 1
-                            elif re_inspection_filtered["score"] > 28 and row["grade"] not in ["C","Z"]:
-                                count += 1
-                        break
-                elif any("Compliance Inspection" in inspection for inspection in inspection_list):
-                    if row["grade"] != "C":
-                        count += 1
-                    break
-                elif any("Reopening Inspection" in inspection for inspection in inspection_list):
-                    continue
-        elif row["action"] in ["Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.","Establishment re-closed by DOHMH."] and row["grade"] != "N":
-            count += 1
-    return count 
+            delta = clean_inspections(restaurant_inspection)
+            inspections = ["permit_number", "inspection_date"]
+            replaced = (snapshot["inspection_date"] >= inspection_mark) | snapshot.set_index(inspections).index.isin(delta.set_index(inspections).index)
+            restaurant_inspection = pd.concat([snapshot[~replaced], delta], axis = 0).reset_index(drop = True)
+            restaurant_inspection = restaurant_inspection.astype({column: "category" for column in CATEGORY_COLUMNS if column in restaurant_inspection})
+    else:
+        restaurant_inspection = clean_inspections(restaurant_inspection)
+    os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+    restaurant_inspection.to_parquet(snapshot_path, index=False)
+    if snapshot is None:
+        record_full_refresh(snapshot_path)
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    return restaurant_inspection.drop(columns = ['record_date'])
+
+def reduce_inspections(df):
+    # Keeps only the rows the grade, audit and clean stages read: each permit's latest gradable inspection, every
+    # closing inspection for closure_history and one row per distinct set of restaurant attributes. Reducing a
+    # concatenation of reduced frames gives the same rows as reducing the whole table at once.
+    df = df.reset_index(drop = True)
+    keep = df["action"].isin(CLOSED_ACTION) | ~df.duplicated(subset=RESTAURANT_COLUMNS)
+    keep.loc[latest_gradable(df).index] = True
+    return df[keep]
+
+def arrow_table(chunk, schema=None):
+    # Categories are stored as plain strings because every page has its own dictionary; columns that are empty
+    # in the first page are typed as strings so later pages with values still fit the schema.
+    chunk = chunk.astype({column: object for column in CATEGORY_COLUMNS if column in chunk})
+    if schema is None:
+        schema = pa.Table.from_pandas(chunk, preserve_index=False).schema
+        schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema], metadata=schema.metadata)
+    return pa.Table.from_pandas(chunk.reindex(columns=schema.names), schema=schema, preserve_index=False)
+
+@counted
+def stream_restaurant_data(url=ODATA_URL, workers=8, checkpoint_dir=CHECKPOINT_DIR, snapshot_path=SNAPSHOT_PATH, consolidate_every=32):
+    # Full download that never holds the whole table: every page is cleaned, typed and appended to the Parquet
+    # snapshot as a row group, and only its reduce_inspections rows are kept. Those are consolidated every
+    # consolidate_every pages, so memory follows the number of permits rather than the number of inspections.
+    # The violation table is read back from the snapshot when publishing.
+    os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+    writer, reduced, records = None, [], 0
+    try:
+        for page in odata_pages(url, None, workers, checkpoint_dir):
+            if page.empty:
+                continue
+            chunk = clean_inspections(page, report_memory=False)
+            table = arrow_table(chunk, writer.schema if writer else None)
+            if writer is None:
+                writer = pq.ParquetWriter(snapshot_path + ".tmp", table.schema)
+            writer.write_table(table)
+            records += len(chunk)
+            reduced.append(reduce_inspections(chunk))
+            if len(reduced) >= consolidate_every:
+                reduced = [reduce_inspections(pd.concat(reduced, axis = 0))]
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"No inspection records returned by {url}")
+    os.replace(snapshot_path + ".tmp", snapshot_path)
+    record_full_refresh(snapshot_path)
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    restaurant_inspection = reduce_inspections(pd.concat(reduced, axis = 0))
+    restaurant_inspection = restaurant_inspection.astype({column: "category" for column in CATEGORY_COLUMNS if column in restaurant_inspection})
+    print(f"Streamed {records} inspection records, kept {len(restaurant_inspection)} for grading")
+    return restaurant_inspection.drop(columns = ['record_date']).reset_index(drop = True)
 
+@counted
+def replace_lat_lon(restaurant, cache_path=GEOCODE_CACHE_PATH, geocoder=None, min_delay_seconds=0.1):
+    missing = restaurant["latitude"].isna() & restaurant["longitude"].isna() & restaurant["street"].notna()
+    street = restaurant.loc[missing, "street"] + ", " + restaurant.loc[missing, "borough"] + ", NY"
+    address = street.where(restaurant.loc[missing, "building"].isna(), restaurant.loc[missing, "building"] + " " + street)
+    # Expired entries are ignored by lookups anyway; purging them keeps the cache from growing with addresses
+    # that are no longer listed.
+    cache = GeocodeCache(cache_path)
+    try:
+        cache.purge_expired()
+        coordinates = geocode_addresses(address.dropna().unique(), cache, geocoder, min_delay_seconds=min_delay_seconds)
+    finally:
+        cache.close()
+    print(f"Geocode cache: {cache.hits} hits, {cache.misses} misses")
+    restaurant.loc[missing, "latitude"] = address.map(lambda x: coordinates.get(x, (np.nan, np.nan))[0]).astype(float)
+    restaurant.loc[missing, "longitude"] = address.map(lambda x: coordinates.get(x, (np.nan, np.nan))[1]).astype(float)
+    return restaurant
+
+def latest_gradable(df):
+    gradable_inspections = df[df["inspection_type"].isin(INITIAL_INSPECTION + RE_INSPECTION + REOPENING_INSPECTION)]
+    return gradable_inspections.sort_values(by=["permit_number","inspection_date"], ascending = [True, False]).drop_duplicates(subset="permit_number")
+
+@counted
+def closure_history(df):
+    # One row per permit describing its most recent closure that decides the grade of a re-opening inspection:
+    # closure_type is the first of initial / re_inspection / compliance found walking closing dates newest first,
+    # with the score and grade of that date's re-inspection. graded_closure_type is the same walk ignoring
+    # re-inspections, which is the rule applied when the re-opening inspection already carries a grade.
+    closed = df[df["action"].isin(CLOSED_ACTION)]
+    inspections_when_closed = closed[["permit_number","inspection_date"]].assign(
+        initial=closed["inspection_type"].isin(INITIAL_INSPECTION).to_numpy(),
+        re_inspection=closed["inspection_type"].isin(RE_INSPECTION).to_numpy(),
+        compliance=closed["inspection_type"].astype(str).str.contains("Compliance Inspection", regex=False).to_numpy())
+    inspections_when_closed = inspections_when_closed.groupby(["permit_number","inspection_date"]).any().reset_index()
+    inspections_when_closed = inspections_when_closed.sort_values(by=["permit_number","inspection_date"], ascending=[True, False])
+
+    decisive = inspections_when_closed[inspections_when_closed[["initial","re_inspection","compliance"]].any(axis=1)].drop_duplicates(subset="permit_number")
+    re_inspections = closed.loc[closed["inspection_type"].isin(RE_INSPECTION), ["permit_number","inspection_date","score","grade"]]
+    decisive = decisive.merge(re_inspections.drop_duplicates(subset=["permit_number","inspection_date"]), how="left", on=["permit_number","inspection_date"])
+    decisive["closure_type"] = np.select([decisive["initial"], decisive["re_inspection"]], ["initial","re_inspection"], "compliance")
+    decisive = decisive.rename(columns={"score": "closure_score", "grade": "closure_grade"}).set_index("permit_number")
+
+    graded = inspections_when_closed[inspections_when_closed["initial"] | inspections_when_closed["compliance"]].drop_duplicates(subset="permit_number")
+    graded = pd.Series(np.where(graded["initial"], "initial", "compliance"), index=graded["permit_number"], name="graded_closure_type")
+    return decisive[["closure_type","closure_score","closure_grade"]].join(graded, how="outer")
+
+@counted
 def gradable_inspection(df):
-    def determine_grade(row):
-        initial_inspection = ['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection']
-        re_inspection = ['Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection']
-        if pd.isna(row['grade']):
-            if pd.notna(row['score']):
-                if row['score'] <= 13 and row["inspection_type"] in initial_inspection+re_inspection:
-                    return 'A'
-                elif row['score'] > 13 and row["inspection_type"] in initial_inspection:
-                    return 'N'
-                elif row["score"] >= 14 and row["score"] <= 28 and row["inspection_type"] in re_inspection:
-                    return 'B'
-                elif row["score"] > 28 and row["inspection_type"] in re_inspection:
-                    return 'C'
-                elif row["inspection_type"] in ['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection']:
-                    if row["action"] == 'Establishment re-opened by DOHMH.':
-                        filtered = restaurant_inspection[(restaurant_inspection["permit_number"]==row["permit_number"])&(restaurant_inspection["action"].isin(["Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.","Establishment re-closed by DOHMH."]))].sort_values(by="inspection_date", ascending=False)
-                        inspections_when_closed = filtered.groupby(["permit_number","inspection_date"])["inspection_type"].agg(list).reset_index().sort_values(by=["permit_number","inspection_date"], ascending=[True, False])
-                        for index in range(len(inspections_when_closed)):
-                            inspection_list = inspections_when_closed.iloc[index,:]["inspection_type"]
-                            if 'Cycle Inspection / Initial Inspection' in inspection_list or 'Pre-permit (Operational) / Initial Inspection' in inspection_list:
-                                return 'P'
-                                break
-                            elif 'Cycle Inspection / Re-inspection' in inspection_list or 'Pre-permit (Operational) / Re-inspection' in inspection_list:
-                                re_inspection_filtered = filtered[filtered["inspection_type"].isin(re_inspection)].iloc[0,:]
-                                if pd.isna(re_inspection_filtered["grade"]):
-                                    if re_inspection_filtered["score"] >= 14 and re_inspection_filtered["score"] <28:
-                                        return 'B'
-                                    elif re_inspection_filtered["score"] >= 28:
-                                        return 'C'
-                                else:
-                                    return re_inspection_filtered["grade"]
-                                break
-                            elif any("Compliance Inspection" in inspection for inspection in inspection_list):
-                                return 'C'
-                                break
-                            elif any("Reopening Inspection" in inspection for inspection in inspection_list):
-                                continue
-                    else:
-                        return "N"
-        elif pd.notna(row["grade"]):
-            closed_action = ['Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.','Establishment re-closed by DOHMH.']
-            if row["inspection_type"] in re_inspection and row["action"] not in closed_action and row["grade"]=="N":
-                if row["score"] <= 13:
-                    return 'A'
-                elif row["score"] >= 14 and row["score"] <= 28:
-                    return 'B'
-                elif row["score"] > 28:
-                    return 'C'
-
-            elif row["inspection_type"] in ['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection']:
-                if row["action"] == 'Establishment re-opened by DOHMH.':
-                    filtered = restaurant_inspection[(restaurant_inspection["permit_number"]==row["permit_number"])&(restaurant_inspection["action"].isin(["Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.","Establishment re-closed by DOHMH."]))].sort_values(by="inspection_date", ascending=False)
-                    inspections_when_closed = filtered.groupby(["permit_number","inspection_date"])["inspection_type"].agg(list).reset_index().sort_values(by=["permit_number","inspection_date"], ascending=[True, False])
-                    for index in range(len(inspections_when_closed)):
-                        inspection_list = inspections_when_closed.iloc[index,:]["inspection_type"]
-                        if 'Cycle Inspection / Initial Inspection' in inspection_list or 'Pre-permit (Operational) / Initial Inspection' in inspection_list:
-                            return 'P'
-                            break
-                        elif any("Compliance Inspection" in inspection for inspection in inspection_list):
-                            return 'C'
-                            break
-                        elif any("Reopening Inspection" in inspection for inspection in inspection_list):
-                            continue
-                else:
-                    return "N"
-
-        return row['grade']
-    
-    condition1 = df["inspection_type"].isin(['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection'])
-    condition2 = df["inspection_type"].isin(['Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection'])
-    condition3 = df["inspection_type"].isin(['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection'])
-    gradable_inspections = df[condition1|condition2|condition3]
-    gradable_inspections = gradable_inspections.sort_values(by=["permit_number","inspection_date"], ascending = [True, False]).drop_duplicates(subset="permit_number")
-    gradable_inspections["grade"] = gradable_inspections.apply(determine_grade, axis=1)
+    gradable_inspections = latest_gradable(df)
+    history = closure_history(df).reindex(gradable_inspections["permit_number"])
+    closure_type = history["closure_type"].to_numpy()
+    closure_score = history["closure_score"].astype(float).to_numpy()
+    closure_grade = history["closure_grade"].to_numpy(dtype=object)
+    reopened_grade = np.select([closure_type == "initial",
+                                (closure_type == "re_inspection") & pd.notna(closure_grade),
+                                (closure_type == "re_inspection") & (closure_score >= 14) & (closure_score < 28),
+                                (closure_type == "re_inspection") & (closure_score >= 28),
+                                closure_type == "compliance"],
+                               ["P", closure_grade, "B", "C", "C"], None)
+    graded_closure_type = history["graded_closure_type"].to_numpy()
+    graded_reopened_grade = np.select([graded_closure_type == "initial", graded_closure_type == "compliance"], ["P", "C"], None)
+
+    score = gradable_inspections["score"].astype(float).to_numpy()
+    grade = gradable_inspections["grade"].to_numpy(dtype=object)
+    initial = gradable_inspections["inspection_type"].isin(INITIAL_INSPECTION).to_numpy()
+    re_inspection = gradable_inspections["inspection_type"].isin(RE_INSPECTION).to_numpy()
+    reopening = gradable_inspections["inspection_type"].isin(REOPENING_INSPECTION).to_numpy()
+    reopened = (gradable_inspections["action"] == REOPENED_ACTION).to_numpy()
+    closed = gradable_inspections["action"].isin(CLOSED_ACTION).to_numpy()
+    ungraded = pd.isna(grade) & ~np.isnan(score)
+    regraded = re_inspection & ~closed & (grade == "N")
+    gradable_inspections["grade"] = np.select([
+        ungraded & (score <= 13) & (initial | re_inspection),
+        ungraded & (score > 13) & initial,
+        ungraded & (score >= 14) & (score <= 28) & re_inspection,
+        ungraded & (score > 28) & re_inspection,
+        ungraded & reopening & reopened,
+        ungraded & reopening,
+        regraded & (score <= 13),
+        regraded & (score >= 14) & (score <= 28),
+        regraded & (score > 28),
+        pd.notna(grade) & reopening & reopened & pd.notna(graded_reopened_grade),
+        pd.notna(grade) & reopening & ~reopened],
+        ["A", "N", "B", "C", reopened_grade, "N", "A", "B", "C", graded_reopened_grade, "N"], grade)
     gradable_inspections.loc[gradable_inspections["action"]=="No violations were recorded at the time of this inspection.","grade"] = "A"
     gradable_inspections.loc[gradable_inspections["grade"]=="N","grade"]="Not Yet Graded"
     gradable_inspections.loc[gradable_inspections["grade"].isin(["Z","P"]),"grade"] = "Grade Pending"
     return gradable_inspections
                 
-def data_preprocessing(df, gc):
-    def custom_title(input_str, preserve_chars):
-        words = input_str.split()
-        result = []
-        for word in words:
-            if any(char.isalpha() for char in word):
-                preserved_word = ''.join(char if char in preserve_chars else char.lower() for char in word)
-                result.append(preserved_word.capitalize())
-            else:
-                result.append(word)
-        return ' '.join(result)
-
-    def img_link(grade):
-        if grade == "A":
-            img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_A.svg"
-        elif grade == "B":
-            img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_B.svg"
-        elif grade == "C":
-            img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_C.svg"
-        elif grade == "Grade Pending":
-            img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_GP.svg"
-        else:
-            img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_NG.svg"
-        return img_src
-    
-    def street_name_converter(street):
-        words = street.split()
-        corrected_words = [word.capitalize() if word.isalpha() else word.replace("ST","st").replace("ND","nd").replace("RD","rd").replace("TH","th") for word in words]
-        street = ' '.join(corrected_words)
-        address_split = street.split()
-        for word in address_split:
-            if word == "West":
-                street = street.replace("West","W")
-            elif word == "East":
-                street = street.replace("East","E")
-            elif word == "Street":
-                street = street.replace("Street","St")
-            elif word == "Avenue":
-                street = street.replace("Avenue","Ave")
-            elif word == "Boulevard":
-                street = street.replace("Boulevard","Blvd")
-            elif word == "Road":
-                street = street.replace("Road", "Rd")
-            elif word == "Parkway":
-                street = street.replace("Parkway", "Pkwy")
-            elif word == "Turnpike":
-                street = street.replace("Turnpike","Tpke")
-            elif word == "Saint":
-                street = street.replace("Saint","St")
-            elif word == "Wyckoff":
-                street = street.replace("Wyckoff","Wyck")
-            elif word == "Expressway":
-                street = street.replace("Expressway", "Expy")
-            elif word == "Place":
-                street = street.replace("Place","Pl")
-            elif word ==  "Lane":
-                street = street.replace("Lane","Ln")
-            elif word == "B'WAY":
-                street = street.replace("B'WAY","Broadway")
-            elif word == "Bldg":
-                street = street.replace("Bldg","Building")
-            elif word == "intairp":
-                street = street.replace("intairp","International Airport")
-            elif word == "Arvl":
-                street = street.replace("Arvl", "Arrival")
-            elif word == "Highway":
-                street = street.replace("Highway","Hwy")
-            elif word == "Ctr":
-                street = street.replace("Ctr","Center")
-            elif word == "Drive":
-                street = street.replace("Drive","Dr")
-            elif word == "Plz":
-                street = street.replace("Plz","Plaza")
-            elif word == "Terrace":
-                street = street.replace("Terrace","Ter")
-            elif word == "Square":
-                street = street.replace("Square","Sq")
-            elif word == "Traverse":
-                street = street.replace("Traverse","Transverse")
-            elif word == "Jfk":
-                street = street.replace("Jfk","John F. Kennedy")
-            else:
-                try:
-                    number = int(word)
-                    if number % 10 == 1:
-                        street = street.replace(word, str(number)+"st")
-                    elif number % 10 == 2:
-                        street = street.replace(word, str(number)+"nd")
-                    elif number % 10 == 3:
-                        street = street.replace(word, str(number)+"rd")
-                    else:
-                        street = street.replace(word, str(number)+"th")
-                except ValueError:
-                    continue
-        return street
-        
-    workbook = gc.open('nyc_restaurant_inspections') 
-    prev_restaurant = workbook[0].get_as_df(numerize=False)
-    prev_restaurant = prev_restaurant.replace("", np.nan)
-    prev_restaurant[["latitude","longitude"]] = prev_restaurant[["latitude","longitude"]].astype(float)
-    restaurant = df[["permit_number","restaurant_name","borough",
-                                        "building","street","zipcode","latitude",
-                                        "longitude","phone","cuisine_description"]]
-    restaurant = restaurant.drop_duplicates(ignore_index = True)
+@counted
+def score_grade_audit(df):
+    # Counts latest gradable inspections whose published grade disagrees with their score or closure history,
+    # overall and per borough and cuisine. records is the number of inspections with both a score and a grade.
+    # Inspections without a borough or cuisine get their own group with a missing value, so the groups add up to all.
+    gradable_inspections = latest_gradable(df)
+    history = closure_history(df).reindex(gradable_inspections["permit_number"])
+    closure_type = history["closure_type"].to_numpy()
+    closure_score = history["closure_score"].astype(float).to_numpy()
+    closure_ungraded = pd.isna(history["closure_grade"].to_numpy(dtype=object))
+
+    score = gradable_inspections["score"].astype(float).to_numpy()
+    grade = pd.Series(gradable_inspections["grade"].to_numpy(dtype=object))
+    graded = grade.notna().to_numpy()
+    action = gradable_inspections["action"]
+    inspection_type = gradable_inspections["inspection_type"]
+    low, mid, high = score <= 13, (score >= 14) & (score <= 27), score >= 28
+
+    audit = pd.DataFrame({
+        "borough": gradable_inspections["borough"].astype(object).to_numpy(),
+        "cuisine_description": gradable_inspections["cuisine_description"].astype(object).to_numpy(),
+        "records": graded & ~np.isnan(score),
+        "initial": inspection_type.isin(INITIAL_INSPECTION).to_numpy() & (
+            (grade.isin(["B","C","N"]).to_numpy() & low) | (grade.isin(["A","B","C"]).to_numpy() & (mid | high))),
+        "re_inspection": inspection_type.isin(RE_INSPECTION).to_numpy() & (
+            (grade.isin(["B","C","N","Z","P"]).to_numpy() & low) | (grade.isin(["A","C","N"]).to_numpy() & mid) | (grade.isin(["A","B","N"]).to_numpy() & high)),
+        "reopening": inspection_type.isin(REOPENING_INSPECTION).to_numpy() & graded & (
+            ((action == REOPENED_ACTION).to_numpy() & (
+                ((closure_type == "initial") & ~grade.isin(["P","Z"]).to_numpy())
+                | ((closure_type == "re_inspection") & closure_ungraded & (closure_score >= 14) & (closure_score <= 28) & ~grade.isin(["B","Z"]).to_numpy())
+                | ((closure_type == "re_inspection") & closure_ungraded & (closure_score > 28) & ~grade.isin(["C","Z"]).to_numpy())
+                | ((closure_type == "compliance") & (grade != "C").to_numpy())))
+            | (action.isin(CLOSED_ACTION).to_numpy() & (grade != "N").to_numpy())),
+        "zero_score_a": (grade == "A").to_numpy() & (score == 0) & (action == "Violations were cited in the following area(s).").to_numpy(),
+    })
+    categories = ["initial", "re_inspection", "reopening", "zero_score_a"]
+    audit["inconsistent"] = audit[categories].sum(axis=1)
+    counts = ["records"] + categories + ["inconsistent"]
+    report = pd.concat([audit[counts].sum().to_frame().T.assign(group="all", value="all")] +
+                       [audit.groupby(column, dropna=False)[counts].sum().rename_axis("value").reset_index().assign(group=column) for column in ["borough", "cuisine_description"]],
+                       ignore_index=True)
+    report["inconsistent_rate"] = report["inconsistent"] / report["records"].where(report["records"] > 0)
+    return report[["group", "value"] + counts + ["inconsistent_rate"]]
+
+def img_link(grade):
+    if grade == "A":
+        img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_A.svg"
+    elif grade == "B":
+        img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_B.svg"
+    elif grade == "C":
+        img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_C.svg"
+    elif grade == "Grade Pending":
+        img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_GP.svg"
+    else:
+        img_src = "https://a816-health.nyc.gov/ABCEatsRestaurants/Content/images/NYCRestaurant_NG.svg"
+    return img_src
+
+@counted
+def restaurant_table(df, prev_restaurant=None):
+    restaurant = df[RESTAURANT_COLUMNS]
+    restaurant = restaurant.drop_duplicates(ignore_index = True).astype({"borough": object, "cuisine_description": object})
     restaurant[["latitude","longitude"]] = restaurant[["latitude","longitude"]].replace(0, np.nan)
-    restaurant = restaurant.set_index(["permit_number"]).fillna(prev_restaurant.set_index(["permit_number"])).reset_index()
-    restaurant.loc[restaurant['latitude'].isnull() | restaurant['longitude'].isnull()] = restaurant.loc[restaurant['latitude'].isnull() | restaurant['longitude'].isnull()].apply(replace_lat_lon, axis=1)
-    gradable_inspections = gradable_inspection(df)
-    restaurant = pd.merge(restaurant, gradable_inspections[["permit_number","grade"]],on="permit_number",how="left")
+    if prev_restaurant is not None and not prev_restaurant.empty:
+        prev_restaurant = prev_restaurant.replace("", np.nan).drop_duplicates(subset="permit_number")
+        prev_restaurant[["latitude","longitude"]] = prev_restaurant[["latitude","longitude"]].astype(float)
+        prev_restaurant["permit_number"] = prev_restaurant["permit_number"].astype("int64")
+        restaurant = restaurant.set_index(["permit_number"]).fillna(prev_restaurant.set_index(["permit_number"])).reset_index()
+    return restaurant
+
+def grade_table(df):
+    return gradable_inspection(df)[["permit_number","grade"]].reset_index(drop=True)
+
+@counted
+def finalize_restaurant(restaurant, grades):
+    restaurant = pd.merge(restaurant, grades,on="permit_number",how="left")
     restaurant["grade"] = restaurant["grade"].fillna("Not Yet Graded")
-    restaurant["restaurant_name"] = restaurant["restaurant_name"].apply(lambda x: custom_title(x, preserve_chars="'"))
-    restaurant["street"] = restaurant["street"].apply(lambda x: street_name_converter(x))
-    restaurant['address'] = restaurant.apply(lambda row: row['street'] if pd.isna(row['building']) else f"{row['building']} {row['street']}", axis=1)
-    restaurant["img_src"] = restaurant["grade"].apply(lambda x: img_link(x))
-    restaurant = restaurant.drop(columns=["building"])
-    violation = df[["permit_number","inspection_date",
-                                        "inspection_type","action", "violation_code",
-                                        "violation_description","critical_flag","score","grade","grade_date"]]
-    return restaurant, violation
-
-
-
-restaurant_inspection = restaurant_data()
-try:
-    json_file = os.environ["JSON_SECRET"]
-except KeyError:
-    json_file = "Json File Not Available"
-SCOPES = ('https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive')
-credentials = service_account.Credentials.from_service_account_info(json.loads(json_file, strict=False), scopes=SCOPES)
-gc = pygsheets.authorize(custom_credentials=credentials)
-restaurant, violation = data_preprocessing(restaurant_inspection, gc)
-
-workbook = gc.open('nyc_restaurant_inspections')
-for worksheet in workbook:
-    worksheet.clear()
-workbook[0].set_dataframe(restaurant, start = 'A1', nan = "")
-workbook[1].set_dataframe(violation, start = 'A1', nan = "") #Add rows up to dataframe length in google sheets first before applying this code
-
-
-#DISCREPANCIES BETWEEN SCORES AND GRADES 
-#condition1 = restaurant_inspection["inspection_type"].isin(['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection'])
-#condition2 = restaurant_inspection["inspection_type"].isin(['Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection'])
-#condition3 = restaurant_inspection["inspection_type"].isin(['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection'])
-#gradable_inspections = restaurant_inspection[condition1|condition2|condition3]
-#gradable_inspections = gradable_inspections.sort_values(by=["permit_number","inspection_date"], ascending = [True, False]).drop_duplicates(subset="permit_number")
-#initial_inspection = ['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection']
-#re_inspection = ['Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection']
-#reop_inspection = ['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection']
-#initial_filtered = gradable_inspections[gradable_inspections["inspection_type"].isin(initial_inspection)]
-#re_filtered = gradable_inspections[gradable_inspections["inspection_type"].isin(re_inspection)]
-#reop_filtered = gradable_inspections[gradable_inspections["inspection_type"].isin(reop_inspection)]
-#inconsistent_initinspect = len(initial_filtered[(initial_filtered["grade"].isin(["B","C","N"]))&(initial_filtered["score"]<=13)].drop_duplicates(subset=["permit_number","inspection_date"]))+len(initial_filtered[(initial_filtered["grade"].isin(["A","B","C"]))&(initial_filtered["score"]>=14)&(initial_filtered["score"]<=27)].drop_duplicates(subset=["permit_number","inspection_date"])) + len(initial_filtered[(initial_filtered["grade"].isin(["A","B","C"]))&(initial_filtered["score"]>=28)].drop_duplicates(subset=["permit_number","inspection_date"]))
-#inconsistent_reinspect = len(re_filtered[(re_filtered["grade"].isin(["B","C","N","Z","P"]))&(re_filtered["score"]<=13)].drop_duplicates(subset=["permit_number","inspection_date"]))+len(re_filtered[(re_filtered["grade"].isin(["A","C","N"]))&(re_filtered["score"]>=14)&(re_filtered["score"]<=27)].drop_duplicates(subset=["permit_number","inspection_date"])) + len(re_filtered[(re_filtered["grade"].isin(["A","B","N"]))&(initial_filtered["score"]>=28)].drop_duplicates(subset=["permit_number","inspection_date"]))
-#reop_filtered["count"] = reop_filtered.apply(reop_inconsistent_count, axis=1)
-#inconsistent_reop = reop_filtered["count"].sum()
-#inconsistent_matches = inconsistent_initinspect + inconsistent_reinspect + inconsistent_reop + len(gradable_inspections[(gradable_inspections["grade"]=="A")&(gradable_inspections["score"]==0)&(gradable_inspections["action"]=='Violations were cited in the following area(s).')])
-#total_records = len(gradable_inspections[(~gradable_inspections["grade"].isna())&(~gradable_inspections["score"].isna())])
-#print(f"Percentage of unmatched score and grade {inconsistent_matches/total_records}")
+    restaurant["restaurant_name"] = map_unique(restaurant["restaurant_name"], title_case)
+    restaurant["street"] = map_unique(restaurant["street"], street_name)
+    restaurant['address'] = street_address(restaurant['building'], restaurant['street'])
+    restaurant["img_src"] = map_unique(restaurant["grade"], img_link)
+    return restaurant.drop(columns=["building"])
+
+def violation_table(df):
+    return df[VIOLATION_COLUMNS]
+
+def snapshot_violations(snapshot_path=SNAPSHOT_PATH, batch_size=100000):
+    # The violation table read back from the snapshot in batches. Categories are decoded per batch, since each
+    # batch would otherwise carry its own dictionary.
+    for batch in pq.ParquetFile(snapshot_path).iter_batches(batch_size=batch_size, columns=VIOLATION_COLUMNS):
+        chunk = batch.to_pandas()
+        yield violation_table(chunk.astype({column: object for column in CATEGORY_COLUMNS if column in chunk}))
+
+@counted
+def data_preprocessing(df, prev_restaurant=None):
+    restaurant = replace_lat_lon(restaurant_table(df, prev_restaurant))
+    restaurant = finalize_restaurant(restaurant, grade_table(df))
+    return restaurant, violation_table(df)
+
+def main(argv=None):
+    # Stages: fetch -> inspections (reduced to the grading rows with --stream), previous_restaurant; clean -> restaurant; geocode -> geocoded; grade -> grades;
+    # audit -> audit; normalize -> normalized; publish. Every stage output is stored as an artifact and only rebuilt
+    # when one of its inputs changed, so later stages can be rerun without downloading again.
+    parser = argparse.ArgumentParser(description="Update the NYC restaurant inspection Google Sheet.")
+    parser.add_argument("--full-refresh", action="store_true", help="re-download the whole dataset instead of the delta since the last snapshot")
+    parser.add_argument("--stream", action="store_true",
+                        help="download the whole dataset page by page into the snapshot, keeping only the rows grading needs in memory; "
+                             "memory stays bounded only with file sinks, the sheets sink loads the whole violation table to diff it")
+    parser.add_argument("--sink", action="append", help="output to write: sheets, parquet[:dir], sqlite[:path] or geojson[:path] (repeatable, default sheets)")
+    parser.add_argument("--state-from", help="sink to read the previous restaurant table from (default: the first --sink)")
+    parser.add_argument("--only", choices=STAGES, help="run a single stage against the cached artifacts of the stages before it")
+    parser.add_argument("--from-cache", action="store_true", help="skip the fetch stage and reuse the last downloaded inspections")
+    parser.add_argument("--force", action="store_true", help="rebuild artifacts even when their inputs are unchanged")
+    parser.add_argument("--artifact-dir", default=ARTIFACT_DIR, help="directory for stage artifacts")
+    parser.add_argument("--audit-report", help="write the score/grade discrepancy audit per borough and cuisine as CSV to this path")
+    parser.add_argument("--profile", help="write per-stage timing, peak RSS and call counts as JSON to this path")
+    args = parser.parse_args(argv)
+
+    stages = [args.only] if args.only else [stage for stage in STAGES if not (args.from_cache and stage == "fetch")]
+    force = args.force or args.only is not None
+    store = ArtifactStore(args.artifact_dir, CODE_PATHS)
+    sinks = [make_sink(spec) for spec in args.sink or ["sheets"]]
+    state_sink = make_sink(args.state_from) if args.state_from else sinks[0]
+    if args.stream and "publish" in stages and any(isinstance(sink, GoogleSheetsSink) for sink in sinks):
+        print("Warning: the sheets sink diffs the whole violation table in memory, so --stream does not bound the publish stage")
 
+    profiler = Profiler()
+    if "fetch" in stages:
+        with profiler.stage("fetch"):
+            store.save("inspections", stream_restaurant_data() if args.stream else restaurant_data(full_refresh=args.full_refresh))
+            prev_restaurant = state_sink.read_restaurant()
+            store.save("previous_restaurant", prev_restaurant if prev_restaurant is not None else pd.DataFrame())
+    if "clean" in stages:
+        with profiler.stage("clean"):
+            store.run("restaurant", ["inspections", "previous_restaurant"], restaurant_table, force)
+    if "geocode" in stages:
+        with profiler.stage("geocode"):
+            store.run("geocoded", ["restaurant"], replace_lat_lon, force)
+    if "grade" in stages:
+        with profiler.stage("grade"):
+            store.run("grades", ["inspections"], grade_table, force)
+    if "audit" in stages:
+        with profiler.stage("audit"):
+            report = store.run("audit", ["inspections"], score_grade_audit, force)
+        print(f"Percentage of unmatched score and grade {report.loc[report['group'] == 'all', 'inconsistent_rate'].iloc[0]:.4f}")
+        if args.audit_report:
+            report.to_csv(args.audit_report, index=False)
+    if "normalize" in stages:
+        with profiler.stage("normalize"):
+            store.run("normalized", ["geocoded", "grades"], finalize_restaurant, force)
+    if "publish" in stages:
+        with profiler.stage("publish"):
+            # Violations are streamed from the snapshot, which holds every row even when the inspections artifact was
+            # streamed; each sink reads its own pass.
+            restaurant = store.load("normalized")
+            for sink in sinks:
+                sink.write(restaurant, snapshot_violations())
+    if args.profile:
+        profiler.dump(args.profile, argv=sys.argv[1:] if argv is None else argv)
 
 
+if __name__ == "__main__":
+    main()
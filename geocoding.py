@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import time
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from geopy.geocoders import ArcGIS
+from geopy.extra.rate_limiter import RateLimiter
+from profiling import counted
+
+GEOCODE_CACHE_PATH = "data/geocode_cache.sqlite"
+
+
+def normalize_address(address):
+    return ", ".join(" ".join(part.split()) for part in address.upper().split(","))
+
+class GeocodeCache:
+    # Coordinates are stored per normalized address. Addresses ArcGIS could not resolve are stored with NULL
+    # coordinates so they are not retried until their entry expires.
+    def __init__(self, path=GEOCODE_CACHE_PATH, ttl_days=180):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS geocode (address TEXT PRIMARY KEY, latitude REAL, longitude REAL, fetched_at REAL)")
+        self.ttl = ttl_days * 86400
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, addresses):
+        addresses = list(addresses)
+        found = {}
+        for start in range(0, len(addresses), 500):
+            chunk = addresses[start:start+500]
+            rows = self.connection.execute(
+                f"SELECT address, latitude, longitude FROM geocode WHERE fetched_at >= ? AND address IN ({','.join('?'*len(chunk))})",
+                [time.time() - self.ttl, *chunk])
+            for address, latitude, longitude in rows:
+                found[address] = (np.nan if latitude is None else latitude, np.nan if longitude is None else longitude)
+        self.hits += len(found)
+        self.misses += len(addresses) - len(found)
+        return found
+
+    def put_many(self, coordinates):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                                        [(address, None if np.isnan(lat) else lat, None if np.isnan(lon) else lon, now) for address, (lat, lon) in coordinates.items()])
+
+    def purge_expired(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM geocode WHERE fetched_at < ?", (time.time() - self.ttl,))
+
+    def close(self):
+        self.connection.close()
+
+@counted
+def geocode_addresses(addresses, cache, geocoder=None, workers=4, min_delay_seconds=0.1):
+    # Cache misses are resolved by one shared geocoder from a bounded thread pool; the RateLimiter spaces the
+    # requests across all workers. Errors are re-raised once the retries are spent, so lookups that fail are returned as
+    # NaN but not cached and are retried next run; only addresses ArcGIS answered without a match are cached as NULL.
+    keys = {address: normalize_address(address) for address in addresses}
+    coordinates = cache.get_many(set(keys.values()))
+    missing = [key for key in set(keys.values()) if key not in coordinates]
+    if missing:
+        geocoder = geocoder or ArcGIS(timeout=10)
+        geocode = RateLimiter(geocoder.geocode, min_delay_seconds=min_delay_seconds, max_retries=2, swallow_exceptions=False)
+
+        def lookup(key):
+            try:
+                location = geocode(key)
+            except Exception:
+                return None
+            if location is None:
+                return np.nan, np.nan
+            return location.latitude, location.longitude
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            resolved = {key: result for key, result in zip(missing, executor.map(lookup, missing)) if result is not None}
+        cache.put_many(resolved)
+        coordinates.update(resolved)
+    return {address: coordinates.get(key, (np.nan, np.nan)) for address, key in keys.items()}
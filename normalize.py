@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import re
+from functools import lru_cache
+
+STREET_TOKENS = {
+    "WEST": "W", "EAST": "E", "STREET": "St", "AVENUE": "Ave", "BOULEVARD": "Blvd", "ROAD": "Rd", "PARKWAY": "Pkwy",
+    "TURNPIKE": "Tpke", "SAINT": "St", "WYCKOFF": "Wyck", "EXPRESSWAY": "Expy", "PLACE": "Pl", "LANE": "Ln",
+    "B'WAY": "Broadway", "BLDG": "Building", "INTAIRP": "International Airport", "ARVL": "Arrival", "HIGHWAY": "Hwy",
+    "CTR": "Center", "DRIVE": "Dr", "PLZ": "Plaza", "TERRACE": "Ter", "SQUARE": "Sq", "TRAVERSE": "Transverse",
+    "JFK": "John F. Kennedy",
+}
+ORDINAL = re.compile(r"^(\d+)(ST|ND|RD|TH)?$", re.IGNORECASE)
+PUNCTUATION = re.compile(r"^(\W*)(.*?)(\W*)$")
+
+
+def ordinal(number):
+    if number % 100 in (11, 12, 13):
+        return f"{number}th"
+    return f"{number}" + {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+
+def street_token(token):
+    # Leading and trailing punctuation is kept aside, so "ST." and "STREET," are normalized like "ST" and "STREET".
+    # Tokens with other characters inside, such as "A-1" or "O'BRIEN", are left as they are.
+    leading, token, trailing = PUNCTUATION.match(token).groups()
+    if not token:
+        return leading + trailing
+    return leading + street_word(token) + trailing
+
+def street_word(token):
+    key = token.upper()
+    if key in STREET_TOKENS:
+        return STREET_TOKENS[key]
+    match = ORDINAL.match(token)
+    if match:
+        return ordinal(int(match.group(1)))
+    if token.isalpha():
+        return token.capitalize()
+    return token
+
+@lru_cache(maxsize=None)
+def street_name(street):
+    return " ".join(street_token(token) for token in street.split())
+
+@lru_cache(maxsize=None)
+def title_case(name, preserve_chars="'"):
+    words = []
+    for word in name.split():
+        if any(char.isalpha() for char in word):
+            words.append(''.join(char if char in preserve_chars else char.lower() for char in word).capitalize())
+        else:
+            words.append(word)
+    return ' '.join(words)
+
+def map_unique(series, function):
+    # Names and streets repeat across many permits, so each distinct value is normalized once and mapped back.
+    uniques = series.dropna().unique()
+    return series.map(dict(zip(uniques, map(function, uniques))))
+
+def street_address(building, street):
+    return street.where(building.isna(), building + " " + street)
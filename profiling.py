@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import sys
+import json
+import time
+import resource
+import functools
+from collections import Counter
+from contextlib import contextmanager
+
+CALL_COUNTS = Counter()
+
+
+def counted(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        CALL_COUNTS[function.__name__] += 1
+        return function(*args, **kwargs)
+    return wrapper
+
+def reset_peak_rss():
+    # Linux resets the VmHWM high-water mark when "5" is written to clear_refs; elsewhere the peak stays
+    # process-wide.
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+class Profiler:
+    # Collects one record per stage: wall time, peak RSS and how often each @counted function was called.
+    def __init__(self):
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, **extra):
+        calls_before = CALL_COUNTS.copy()
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append({"stage": name, "seconds": round(time.perf_counter() - start, 4),
+                                 "peak_rss_mb": round(peak_rss_mb(), 1), "calls": dict(CALL_COUNTS - calls_before), **extra})
+
+    def dump(self, path, **metadata):
+        with open(path, "w") as f:
+            json.dump({**metadata, "stages": self.records}, f, indent=2)
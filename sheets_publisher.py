@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import numpy as np
+import pandas as pd
+from artifacts import frame_hash
+from profiling import counted
+
+PUBLISHED_DIR = "data/published"
+MAX_CELLS_PER_BATCH = 40000
+SNAPSHOT_METADATA_KEY = "published_snapshot"
+
+
+def column_letter(number):
+    letters = ""
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+def sheet_cells(df):
+    cells = df.copy()
+    for column in cells.columns:
+        if pd.api.types.is_datetime64_any_dtype(cells[column]):
+            cells[column] = cells[column].dt.strftime("%Y-%m-%d")
+    cells = cells.astype(object)
+    return cells.where(cells.notna(), "").astype(str).reset_index(drop=True)
+
+def row_keys(cells, key):
+    # Rows sharing a key are told apart by their rank in content order, so duplicate keys are never collapsed and
+    # unchanged duplicates match the same rows whatever order the frame and the sheet list them in.
+    duplicated = cells.duplicated(key, keep=False)
+    occurrence = pd.Series(0, index=cells.index)
+    occurrence[duplicated] = cells[duplicated].sort_values(list(cells.columns)).groupby(key, sort=False).cumcount()
+    occurrence = occurrence.astype(str)
+    return list(zip(*[cells[column] for column in key], occurrence))
+
+def snapshot_marker(worksheet):
+    # Developer metadata on the worksheet holding the hash of the layout last written to it in full. It is cleared
+    # before any write, so a run that fails midway leaves it unset.
+    markers = worksheet.get_developer_metadata(SNAPSHOT_METADATA_KEY)
+    return markers[0] if markers else worksheet.create_developer_metadata(SNAPSHOT_METADATA_KEY, "")
+
+def set_marker(marker, value):
+    marker.value = value
+    marker.update()
+
+@counted
+def write_rows(worksheet, start_row, values, width, max_cells=MAX_CELLS_PER_BATCH):
+    # values is a list of (sheet_row, cells) pairs sorted by row; consecutive rows are sent as one range and
+    # ranges are grouped into batch requests of at most max_cells cells.
+    runs = []
+    for row, cells in values:
+        if runs and runs[-1][0] + len(runs[-1][1]) == row:
+            runs[-1][1].append(cells)
+        else:
+            runs.append((row, [cells]))
+    ranges, batch, batch_cells = [], [], 0
+    rows_per_range = max(1, max_cells // width)
+    for row, cells in runs:
+        for offset in range(0, len(cells), rows_per_range):
+            chunk = cells[offset:offset+rows_per_range]
+            if batch_cells + len(chunk) * width > max_cells and batch:
+                worksheet.update_values_batch(ranges, batch)
+                ranges, batch, batch_cells = [], [], 0
+            first = start_row + row + offset
+            ranges.append(f"A{first}:{column_letter(width)}{first + len(chunk) - 1}")
+            batch.append(chunk)
+            batch_cells += len(chunk) * width
+    if batch:
+        worksheet.update_values_batch(ranges, batch)
+
+@counted
+def publish_frame(worksheet, df, key, snapshot_path, max_cells=MAX_CELLS_PER_BATCH):
+    # Rows are matched to the last published snapshot by key. Changed rows are rewritten in place, new rows take
+    # the slots of deleted ones or are appended, and leftover holes are filled from the bottom before the sheet
+    # is shrunk, so only rows whose content moved or changed are sent. The whole frame is written when there is
+    # no snapshot or it does not match the sheet: the snapshot's hash must equal the worksheet's snapshot marker,
+    # which catches snapshots restored from an older cache and sheets left half-written by a failed run.
+    cells = sheet_cells(df)
+    header = list(cells.columns)
+    marker = snapshot_marker(worksheet)
+    previous = pd.read_parquet(snapshot_path) if os.path.exists(snapshot_path) else None
+    if (previous is None or list(previous.columns) != header or worksheet.rows != len(previous) + 1
+            or marker.value != frame_hash(previous)):
+        layout = cells
+        dirty = np.arange(len(layout))
+        header_dirty = True
+    else:
+        new_keys = row_keys(cells, key)
+        previous_keys = set(row_keys(previous, key))
+        position = dict(zip(new_keys, range(len(cells))))
+        slots = [position.get(row_key) for row_key in row_keys(previous, key)]
+        inserts = [index for index, row_key in enumerate(new_keys) if row_key not in previous_keys]
+        holes = [slot for slot, index in enumerate(slots) if index is None]
+        for hole, index in zip(holes, inserts):
+            slots[hole] = index
+        slots.extend(inserts[len(holes):])
+        for hole in holes[len(inserts):]:
+            while slots and slots[-1] is None:
+                slots.pop()
+            if hole >= len(slots):
+                break
+            slots[hole] = slots.pop()
+        while slots and slots[-1] is None:
+            slots.pop()
+        layout = cells.iloc[slots].reset_index(drop=True)
+        overlap = min(len(layout), len(previous))
+        changed = (layout.iloc[:overlap].to_numpy() != previous.iloc[:overlap].to_numpy()).any(axis=1)
+        dirty = np.concatenate([np.flatnonzero(changed), np.arange(overlap, len(layout))])
+        header_dirty = False
+
+    set_marker(marker, "")
+    if worksheet.rows < len(layout) + 1 or worksheet.cols != len(header):
+        worksheet.resize(rows=max(worksheet.rows, len(layout) + 1), cols=len(header))
+    values = layout.to_numpy().tolist()
+    updates = ([(0, header)] if header_dirty else []) + [(int(row) + 1, values[row]) for row in dirty]
+    write_rows(worksheet, 1, updates, len(header), max_cells)
+    if worksheet.rows != len(layout) + 1:
+        worksheet.resize(rows=len(layout) + 1)
+    set_marker(marker, frame_hash(layout))
+
+    os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+    layout.to_parquet(snapshot_path, index=False)
+    print(f"Published {worksheet.title}: {len(dirty)} of {len(layout)} rows written")
+    return len(dirty)
+
+class FakeMetadata:
+    def __init__(self, key, value=None):
+        self.key = key
+        self.value = value
+
+    def update(self):
+        pass
+
+class FakeWorksheet:
+    # In-memory stand-in for a pygsheets Worksheet implementing the calls publish_frame makes.
+    def __init__(self, title="Sheet1", rows=1000, cols=26):
+        self.title = title
+        self.rows = rows
+        self.cols = cols
+        self.values = {}
+        self.metadata = []
+        self.requests = 0
+        self.cells_written = 0
+
+    def resize(self, rows=None, cols=None):
+        self.rows = rows if rows is not None else self.rows
+        self.cols = cols if cols is not None else self.cols
+        self.values = {row: cells[:self.cols] for row, cells in self.values.items() if row <= self.rows}
+        self.requests += 1
+
+    def update_values_batch(self, ranges, values):
+        for crange, rows in zip(ranges, values):
+            first = int(crange.split(":")[0].lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+            for offset, cells in enumerate(rows):
+                if first + offset > self.rows or len(cells) > self.cols:
+                    raise ValueError(f"Range {crange} exceeds grid limits")
+                self.values[first + offset] = list(cells)
+                self.cells_written += len(cells)
+        self.requests += 1
+
+    def get_all_values(self):
+        return [self.values.get(row, [""] * self.cols) for row in range(1, self.rows + 1)]
+
+    def get_developer_metadata(self, key=None):
+        return [metadata for metadata in self.metadata if key is None or metadata.key == key]
+
+    def create_developer_metadata(self, key, value=None):
+        self.metadata.append(FakeMetadata(key, value))
+        return self.metadata[-1]
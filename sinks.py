@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import shutil
+import sqlite3
+from contextlib import closing
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+import pygsheets
+from google.oauth2 import service_account
+from sheets_publisher import publish_frame, PUBLISHED_DIR
+
+WORKBOOK_NAME = "nyc_restaurant_inspections"
+SCOPES = ('https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive')
+RESTAURANT_KEY = ["permit_number"]
+VIOLATION_KEY = ["permit_number", "inspection_date", "violation_code"]
+UNKNOWN_BOROUGH = "Unknown"
+
+
+class Sink(ABC):
+    # A destination for the restaurant and violation tables that can also return the restaurant table it
+    # last received, which data_preprocessing uses to backfill coordinates. read_restaurant returns None
+    # when nothing has been written yet. violation is an iterable of DataFrame chunks, so file sinks can write
+    # it without holding the whole table.
+    @abstractmethod
+    def write(self, restaurant, violation):
+        pass
+
+    @abstractmethod
+    def read_restaurant(self):
+        pass
+
+class GoogleSheetsSink(Sink):
+    def __init__(self, workbook_name=WORKBOOK_NAME, published_dir=PUBLISHED_DIR):
+        self.workbook_name = workbook_name
+        self.published_dir = published_dir
+        self._workbook = None
+
+    @property
+    def workbook(self):
+        if self._workbook is None:
+            try:
+                json_file = os.environ["JSON_SECRET"]
+            except KeyError:
+                json_file = "Json File Not Available"
+            credentials = service_account.Credentials.from_service_account_info(json.loads(json_file, strict=False), scopes=SCOPES)
+            self._workbook = pygsheets.authorize(custom_credentials=credentials).open(self.workbook_name)
+        return self._workbook
+
+    def write(self, restaurant, violation):
+        # The diff against the published snapshot needs the whole violation table, so it is collected here and
+        # publish_frame copies it again; memory grows with the table even when the chunks were streamed.
+        violation = pd.concat(list(violation), ignore_index=True)
+        publish_frame(self.workbook[0], restaurant, RESTAURANT_KEY, os.path.join(self.published_dir, "restaurant.parquet"))
+        publish_frame(self.workbook[1], violation, VIOLATION_KEY, os.path.join(self.published_dir, "violation.parquet"))
+
+    def read_restaurant(self):
+        return self.workbook[0].get_as_df(numerize=False)
+
+class ParquetSink(Sink):
+    # Restaurants are partitioned by borough and violations by inspection year. Restaurants without a borough go
+    # to an UNKNOWN_BOROUGH partition and come back with a missing borough.
+    def __init__(self, path="data/parquet"):
+        self.path = path
+
+    def _write_dataset(self, chunks, name, partition_cols):
+        # Every chunk adds its own files to the partitions, so chunks are written one at a time.
+        target = os.path.join(self.path, name)
+        shutil.rmtree(target + ".tmp", ignore_errors=True)
+        os.makedirs(target + ".tmp")
+        for df in chunks:
+            df.to_parquet(target + ".tmp", partition_cols=partition_cols, index=False)
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(target + ".tmp", target)
+
+    def write(self, restaurant, violation):
+        os.makedirs(self.path, exist_ok=True)
+        self._write_dataset([restaurant.assign(borough=restaurant["borough"].fillna(UNKNOWN_BOROUGH))], "restaurant", ["borough"])
+        self._write_dataset((chunk.assign(inspection_year=chunk["inspection_date"].dt.year) for chunk in violation), "violation", ["inspection_year"])
+
+    def read_restaurant(self):
+        path = os.path.join(self.path, "restaurant")
+        if not os.path.exists(path):
+            return None
+        restaurant = pd.read_parquet(path)
+        return restaurant.assign(borough=restaurant["borough"].astype(object).replace(UNKNOWN_BOROUGH, np.nan))
+
+class SQLiteSink(Sink):
+    def __init__(self, path="data/restaurants.sqlite"):
+        self.path = path
+
+    def write(self, restaurant, violation):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path + ".tmp"):
+            os.remove(self.path + ".tmp")
+        connection = sqlite3.connect(self.path + ".tmp")
+        with connection:
+            restaurant.to_sql("restaurant", connection, index=False, chunksize=10000)
+            for chunk in violation:
+                chunk.to_sql("violation", connection, index=False, if_exists="append", chunksize=10000)
+            connection.execute("CREATE INDEX restaurant_permit_number ON restaurant (permit_number)")
+            connection.execute("CREATE INDEX restaurant_borough ON restaurant (borough)")
+            connection.execute("CREATE INDEX violation_permit_number ON violation (permit_number, inspection_date)")
+        connection.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def read_restaurant(self):
+        if not os.path.exists(self.path):
+            return None
+        with closing(sqlite3.connect(self.path)) as connection:
+            return pd.read_sql("SELECT * FROM restaurant", connection)
+
+class GeoJSONSink(Sink):
+    # Restaurants with coordinates as a GeoJSON FeatureCollection, ready for web maps or tile builders such as
+    # tippecanoe. Violations are not exported.
+    def __init__(self, path="data/restaurants.geojson"):
+        self.path = path
+
+    def write(self, restaurant, violation):
+        located = restaurant[restaurant["latitude"].notna() & restaurant["longitude"].notna()]
+        properties = located.drop(columns=["latitude", "longitude"]).astype(object)
+        properties = properties.where(properties.notna(), None).to_dict(orient="records")
+        features = [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [round(lon, 6), round(lat, 6)]}, "properties": props}
+                    for lat, lon, props in zip(located["latitude"], located["longitude"], properties)]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f, default=str)
+        os.replace(self.path + ".tmp", self.path)
+
+    def read_restaurant(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as f:
+            features = json.load(f)["features"]
+        restaurant = pd.DataFrame([feature["properties"] for feature in features])
+        coordinates = np.array([feature["geometry"]["coordinates"] for feature in features], dtype=float).reshape(-1, 2)
+        return restaurant.assign(latitude=coordinates[:, 1], longitude=coordinates[:, 0])
+
+def make_sink(spec):
+    # "sheets", or "parquet", "sqlite", "geojson" with an optional ":path".
+    kind, _, path = spec.partition(":")
+    sinks = {"sheets": GoogleSheetsSink, "parquet": ParquetSink, "sqlite": SQLiteSink, "geojson": GeoJSONSink}
+    if kind not in sinks:
+        raise ValueError(f"Unknown sink {spec!r}, expected one of {', '.join(sinks)}")
+    return sinks[kind](path) if path else sinks[kind]()
@@ -0,0 +1,24 @@
+import pandas as pd
+from artifacts import ArtifactStore
+
+
+def test_run_rebuilds_when_code_paths_change(tmp_path):
+    helper = tmp_path / "helper.py"
+    helper.write_text("SCALE = 2\n")
+    calls = []
+
+    def double(df):
+        calls.append(1)
+        return df * 2
+
+    store = ArtifactStore(str(tmp_path / "artifacts"), [str(helper)])
+    store.save("input", pd.DataFrame({"value": [1, 2]}))
+    store.run("output", ["input"], double)
+    store.run("output", ["input"], double)
+    assert len(calls) == 1
+
+    # A change in a module the stage calls into invalidates the artifact even though double itself is unchanged.
+    helper.write_text("SCALE = 3\n")
+    store = ArtifactStore(str(tmp_path / "artifacts"), [str(helper)])
+    store.run("output", ["input"], double)
+    assert len(calls) == 2
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import synthetic_page
+from data_update import score_grade_audit, clean_inspections
+from test_grading import INITIAL, RE_INSPECTION, REOPENING, COMPLIANCE, CITED, NO_VIOLATIONS, CLOSED, RECLOSED, REOPENED, history_frame
+
+CATEGORIES = ["initial", "re_inspection", "reopening", "zero_score_a"]
+# The legacy re-inspection formula indexes with a mask built on other rows; see LEGACY_MISSES.
+pytestmark = pytest.mark.filterwarnings("ignore:Boolean Series key will be reindexed")
+
+
+def legacy_audit(restaurant_inspection):
+    # Frozen copy of the commented-out discrepancy block and the row-wise reop_inconsistent_count that
+    # score_grade_audit replaced; restaurant_inspection and re_inspection were module globals there. The only changes
+    # are the copy of reop_filtered before its count column is set and the guard for when it is empty, where the
+    # row-wise apply cannot be assigned to a column.
+    re_inspection = ['Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection']
+
+    def reop_inconsistent_count(row):
+        count = 0
+        if pd.notna(row["grade"]):
+            if row["action"]=="Establishment re-opened by DOHMH.":
+                filtered = restaurant_inspection[(restaurant_inspection["permit_number"]==row["permit_number"])&(restaurant_inspection["action"].isin(["Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.","Establishment re-closed by DOHMH."]))].sort_values(by="inspection_date", ascending=False)
+                inspections_when_closed = filtered.groupby(["permit_number","inspection_date"])["inspection_type"].agg(list).reset_index().sort_values(by=["permit_number","inspection_date"], ascending=[True, False])
+                for index in range(len(inspections_when_closed)):
+                    inspection_list = inspections_when_closed.iloc[index,:]["inspection_type"]
+                    if 'Cycle Inspection / Initial Inspection' in inspection_list or 'Pre-permit (Operational) / Initial Inspection' in inspection_list:
+                        if row["grade"] not in ["P","Z"]:
+                            count += 1
+                        break
+                    elif 'Cycle Inspection / Re-inspection' in inspection_list or 'Pre-permit (Operational) / Re-inspection' in inspection_list:
+                            re_inspection_filtered = filtered[filtered["inspection_type"].isin(re_inspection)].iloc[0,:]
+                            if pd.isna(re_inspection_filtered["grade"]):
+                                if re_inspection_filtered["score"] >= 14 and re_inspection_filtered["score"] <=28 and row["grade"] not in ["B","Z"]:
+                                    count += 1
+                                elif re_inspection_filtered["score"] > 28 and row["grade"] not in ["C","Z"]:
+                                    count += 1
+                            break
+                    elif any("Compliance Inspection" in inspection for inspection in inspection_list):
+                        if row["grade"] != "C":
+                            count += 1
+                        break
+                    elif any("Reopening Inspection" in inspection for inspection in inspection_list):
+                        continue
+            elif row["action"] in ["Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.","Establishment re-closed by DOHMH."] and row["grade"] != "N":
+                count += 1
+        return count
+
+    condition1 = restaurant_inspection["inspection_type"].isin(['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection'])
+    condition2 = restaurant_inspection["inspection_type"].isin(['Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection'])
+    condition3 = restaurant_inspection["inspection_type"].isin(['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection'])
+    gradable_inspections = restaurant_inspection[condition1|condition2|condition3]
+    gradable_inspections = gradable_inspections.sort_values(by=["permit_number","inspection_date"], ascending = [True, False]).drop_duplicates(subset="permit_number")
+    initial_inspection = ['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection']
+    reop_inspection = ['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection']
+    initial_filtered = gradable_inspections[gradable_inspections["inspection_type"].isin(initial_inspection)]
+    re_filtered = gradable_inspections[gradable_inspections["inspection_type"].isin(re_inspection)]
+    reop_filtered = gradable_inspections[gradable_inspections["inspection_type"].isin(reop_inspection)].copy()
+    inconsistent_initinspect = len(initial_filtered[(initial_filtered["grade"].isin(["B","C","N"]))&(initial_filtered["score"]<=13)].drop_duplicates(subset=["permit_number","inspection_date"]))+len(initial_filtered[(initial_filtered["grade"].isin(["A","B","C"]))&(initial_filtered["score"]>=14)&(initial_filtered["score"]<=27)].drop_duplicates(subset=["permit_number","inspection_date"])) + len(initial_filtered[(initial_filtered["grade"].isin(["A","B","C"]))&(initial_filtered["score"]>=28)].drop_duplicates(subset=["permit_number","inspection_date"]))
+    inconsistent_reinspect = len(re_filtered[(re_filtered["grade"].isin(["B","C","N","Z","P"]))&(re_filtered["score"]<=13)].drop_duplicates(subset=["permit_number","inspection_date"]))+len(re_filtered[(re_filtered["grade"].isin(["A","C","N"]))&(re_filtered["score"]>=14)&(re_filtered["score"]<=27)].drop_duplicates(subset=["permit_number","inspection_date"])) + len(re_filtered[(re_filtered["grade"].isin(["A","B","N"]))&(initial_filtered["score"]>=28)].drop_duplicates(subset=["permit_number","inspection_date"]))
+    reop_filtered["count"] = reop_filtered.apply(reop_inconsistent_count, axis=1) if len(reop_filtered) else 0
+    inconsistent_reop = reop_filtered["count"].sum()
+    zero_score_a = len(gradable_inspections[(gradable_inspections["grade"]=="A")&(gradable_inspections["score"]==0)&(gradable_inspections["action"]=='Violations were cited in the following area(s).')])
+    total_records = len(gradable_inspections[(~gradable_inspections["grade"].isna())&(~gradable_inspections["score"].isna())])
+    return {"records": total_records, "initial": inconsistent_initinspect, "re_inspection": inconsistent_reinspect, "reopening": int(inconsistent_reop), "zero_score_a": zero_score_a}
+
+# Each history is a list of (day, inspection_type, action, score, grade) for one permit, paired with the category
+# its latest gradable inspection is expected to be counted in, if any.
+HISTORIES = {
+    "initial consistent": ([(1, INITIAL, CITED, 10, "A")], None),
+    "initial ungraded": ([(1, INITIAL, CITED, 20, None)], None),
+    "initial low score graded B": ([(1, INITIAL, CITED, 10, "B")], "initial"),
+    "initial low score not yet graded": ([(1, INITIAL, CITED, 12, "N")], "initial"),
+    "initial mid score graded A": ([(1, INITIAL, CITED, 20, "A")], "initial"),
+    "initial high score graded C": ([(1, INITIAL, CITED, 30, "C")], "initial"),
+    "re-inspection consistent B": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, 20, "B")], None),
+    "re-inspection consistent C": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, 35, "C")], None),
+    "re-inspection low score pending": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, 10, "P")], "re_inspection"),
+    "re-inspection low score graded B": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, 10, "B")], "re_inspection"),
+    "re-inspection mid score graded A": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, 20, "A")], "re_inspection"),
+    "re-inspection high score graded B": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, 35, "B")], "re_inspection"),
+    "reopened after initial closure, graded A": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, REOPENED, 5, "A")], "reopening"),
+    "reopened after initial closure, pending": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, REOPENED, 5, "P")], None),
+    "reopened after mid re-inspection closure, graded C": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 20, None), (25, REOPENING, REOPENED, 5, "C")], "reopening"),
+    "reopened after mid re-inspection closure, graded B": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 28, None), (25, REOPENING, REOPENED, 5, "B")], None),
+    "reopened after high re-inspection closure, graded B": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 30, None), (25, REOPENING, REOPENED, 5, "B")], "reopening"),
+    "reopened after high re-inspection closure, pending": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 30, None), (25, REOPENING, REOPENED, 5, "Z")], None),
+    "reopened after graded re-inspection closure": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 30, "B"), (25, REOPENING, REOPENED, 5, "A")], None),
+    "reopened after compliance closure, graded A": ([(1, INITIAL, CLOSED, 40, None), (5, COMPLIANCE, RECLOSED, 30, None), (9, REOPENING, REOPENED, 5, "A")], "reopening"),
+    "reopened after compliance closure, graded C": ([(1, INITIAL, CLOSED, 40, None), (5, COMPLIANCE, RECLOSED, 30, None), (9, REOPENING, REOPENED, 5, "C")], None),
+    "re-closed on reopening then initial, graded A": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, RECLOSED, 20, None), (9, REOPENING, REOPENED, 5, "A")], "reopening"),
+    "reopening still closed, graded A": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, RECLOSED, 20, "A")], "reopening"),
+    "reopening still closed, not yet graded": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, RECLOSED, 20, "N")], None),
+    "reopening ungraded": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, REOPENED, 5, None)], None),
+    "reopened without closure": ([(5, REOPENING, REOPENED, 5, "A")], None),
+    "zero score A with violations": ([(1, INITIAL, CITED, 0, "A")], "zero_score_a"),
+    "zero score A without violations": ([(1, INITIAL, NO_VIOLATIONS, 0, "A")], None),
+}
+# The legacy high-score re-inspection term masks re_filtered with initial_filtered["score"], which pandas aligns on
+# the index of the initial rows, so it never matched; score_grade_audit applies the intended re-inspection score.
+LEGACY_MISSES = {"re-inspection high score graded B"}
+
+
+def audit_frame(histories):
+    df = history_frame(histories)
+    return df.assign(borough=np.resize(["Manhattan", "Queens", None], len(df)), cuisine_description=np.resize(["Pizza", None], len(df)))
+
+def totals(report):
+    return report[report["group"] == "all"].iloc[0][["records"] + CATEGORIES].astype(int).to_dict()
+
+@pytest.mark.parametrize("name", list(HISTORIES))
+def test_history(name):
+    history, expected = HISTORIES[name]
+    df = audit_frame([history])
+    counts = {category: int(category == expected) for category in CATEGORIES}
+    assert {category: totals(score_grade_audit(df))[category] for category in CATEGORIES} == counts
+    legacy = legacy_audit(df)
+    assert {category: legacy[category] for category in CATEGORIES} == (dict.fromkeys(CATEGORIES, 0) if name in LEGACY_MISSES else counts)
+    assert totals(score_grade_audit(df))["records"] == legacy["records"]
+
+def test_fixture_histories_together():
+    df = audit_frame([history for history, _ in HISTORIES.values()])
+    report = score_grade_audit(df)
+    expected = legacy_audit(df)
+    expected["re_inspection"] += len(LEGACY_MISSES)
+    assert totals(report) == expected
+
+    # Rows without a borough or cuisine are counted in a group of their own, so every grouping adds up to all.
+    for column in ["borough", "cuisine_description"]:
+        groups = report[report["group"] == column]
+        assert groups["value"].isna().sum() == 1
+        assert groups[["records"] + CATEGORIES + ["inconsistent"]].sum().tolist() == report[report["group"] == "all"][["records"] + CATEGORIES + ["inconsistent"]].iloc[0].tolist()
+
+@pytest.mark.parametrize("seed", range(3))
+def test_synthetic_histories(seed):
+    df = clean_inspections(pd.DataFrame(synthetic_page(0, 3000, seed)), report_memory=False)
+    legacy = df.astype({"inspection_type": object, "action": object, "score": float})
+    assert totals(score_grade_audit(df)) == legacy_audit(legacy)
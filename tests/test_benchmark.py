@@ -0,0 +1,12 @@
+import json
+from benchmark import write_pages
+
+
+def test_pages_do_not_share_permits(tmp_path):
+    write_pages(str(tmp_path), 2500, 1000, 0)
+    permits = []
+    for index in range(3):
+        with open(tmp_path / f"page_{index}.json") as f:
+            permits.append({row["camis"] for row in json.load(f)})
+    assert all(permits)
+    assert len(set.union(*permits)) == sum(map(len, permits))
@@ -0,0 +1,49 @@
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+import pytest
+from geopy.exc import GeocoderTimedOut
+from geopy.extra.rate_limiter import RateLimiter
+from geocoding import GeocodeCache, geocode_addresses
+import data_update
+from data_update import replace_lat_lon
+
+
+class Location:
+    latitude = 40.7
+    longitude = -74.0
+
+class FlakyGeocoder:
+    def geocode(self, query):
+        if query.startswith("1 "):
+            raise GeocoderTimedOut("timed out")
+        return None if query.startswith("2 ") else Location()
+
+def test_failed_lookups_are_not_cached(monkeypatch, tmp_path):
+    monkeypatch.setattr(RateLimiter, "_sleep", lambda self, seconds: None)
+    cache = GeocodeCache(str(tmp_path / "geocode.sqlite"))
+    coordinates = geocode_addresses(["1 Broadway, Manhattan, NY", "2 Broadway, Manhattan, NY", "3 Broadway, Manhattan, NY"], cache, FlakyGeocoder(), min_delay_seconds=0)
+    assert np.isnan(coordinates["1 Broadway, Manhattan, NY"]).all()
+    assert np.isnan(coordinates["2 Broadway, Manhattan, NY"]).all()
+    assert coordinates["3 Broadway, Manhattan, NY"] == (40.7, -74.0)
+    assert sorted(address for address, in cache.connection.execute("SELECT address FROM geocode")) == ["2 BROADWAY, MANHATTAN, NY", "3 BROADWAY, MANHATTAN, NY"]
+
+def test_replace_lat_lon_purges_and_closes_cache(monkeypatch, tmp_path):
+    cache_path = str(tmp_path / "geocode.sqlite")
+    cache = GeocodeCache(cache_path, ttl_days=180)
+    cache.put_many({"OLD ADDRESS, MANHATTAN, NY": (40.0, -73.0)})
+    cache.connection.execute("UPDATE geocode SET fetched_at = 0")
+    cache.connection.commit()
+    cache.close()
+    restaurant = pd.DataFrame({"building": ["3"], "street": ["BROADWAY"], "borough": ["Manhattan"], "latitude": [np.nan], "longitude": [np.nan]})
+    replace_lat_lon(restaurant, cache_path, FlakyGeocoder(), min_delay_seconds=0)
+    with closing(sqlite3.connect(cache_path)) as connection:
+        assert [address for address, in connection.execute("SELECT address FROM geocode")] == ["3 BROADWAY, MANHATTAN, NY"]
+
+    closed = []
+    monkeypatch.setattr(GeocodeCache, "close", lambda self: closed.append(self.connection.close()))
+    monkeypatch.setattr(data_update, "geocode_addresses", lambda *args, **kwargs: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        replace_lat_lon(restaurant, cache_path, FlakyGeocoder(), min_delay_seconds=0)
+    assert len(closed) == 1
@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import synthetic_page
+from data_update import gradable_inspection, clean_inspections
+
+INITIAL = "Cycle Inspection / Initial Inspection"
+RE_INSPECTION = "Cycle Inspection / Re-inspection"
+REOPENING = "Cycle Inspection / Reopening Inspection"
+COMPLIANCE = "Cycle Inspection / Compliance Inspection"
+CITED = "Violations were cited in the following area(s)."
+NO_VIOLATIONS = "No violations were recorded at the time of this inspection."
+CLOSED = "Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed."
+RECLOSED = "Establishment re-closed by DOHMH."
+REOPENED = "Establishment re-opened by DOHMH."
+
+
+def legacy_gradable_inspection(restaurant_inspection):
+    # Frozen copy of the row-wise implementation gradable_inspection replaced; restaurant_inspection was a module
+    # global there.
+    def determine_grade(row):
+        initial_inspection = ['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection']
+        re_inspection = ['Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection']
+        if pd.isna(row['grade']):
+            if pd.notna(row['score']):
+                if row['score'] <= 13 and row["inspection_type"] in initial_inspection+re_inspection:
+                    return 'A'
+                elif row['score'] > 13 and row["inspection_type"] in initial_inspection:
+                    return 'N'
+                elif row["score"] >= 14 and row["score"] <= 28 and row["inspection_type"] in re_inspection:
+                    return 'B'
+                elif row["score"] > 28 and row["inspection_type"] in re_inspection:
+                    return 'C'
+                elif row["inspection_type"] in ['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection']:
+                    if row["action"] == 'Establishment re-opened by DOHMH.':
+                        filtered = restaurant_inspection[(restaurant_inspection["permit_number"]==row["permit_number"])&(restaurant_inspection["action"].isin(["Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.","Establishment re-closed by DOHMH."]))].sort_values(by="inspection_date", ascending=False)
+                        inspections_when_closed = filtered.groupby(["permit_number","inspection_date"])["inspection_type"].agg(list).reset_index().sort_values(by=["permit_number","inspection_date"], ascending=[True, False])
+                        for index in range(len(inspections_when_closed)):
+                            inspection_list = inspections_when_closed.iloc[index,:]["inspection_type"]
+                            if 'Cycle Inspection / Initial Inspection' in inspection_list or 'Pre-permit (Operational) / Initial Inspection' in inspection_list:
+                                return 'P'
+                                break
+                            elif 'Cycle Inspection / Re-inspection' in inspection_list or 'Pre-permit (Operational) / Re-inspection' in inspection_list:
+                                re_inspection_filtered = filtered[filtered["inspection_type"].isin(re_inspection)].iloc[0,:]
+                                if pd.isna(re_inspection_filtered["grade"]):
+                                    if re_inspection_filtered["score"] >= 14 and re_inspection_filtered["score"] <28:
+                                        return 'B'
+                                    elif re_inspection_filtered["score"] >= 28:
+                                        return 'C'
+                                else:
+                                    return re_inspection_filtered["grade"]
+                                break
+                            elif any("Compliance Inspection" in inspection for inspection in inspection_list):
+                                return 'C'
+                                break
+                            elif any("Reopening Inspection" in inspection for inspection in inspection_list):
+                                continue
+                    else:
+                        return "N"
+        elif pd.notna(row["grade"]):
+            closed_action = ['Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.','Establishment re-closed by DOHMH.']
+            if row["inspection_type"] in re_inspection and row["action"] not in closed_action and row["grade"]=="N":
+                if row["score"] <= 13:
+                    return 'A'
+                elif row["score"] >= 14 and row["score"] <= 28:
+                    return 'B'
+                elif row["score"] > 28:
+                    return 'C'
+
+            elif row["inspection_type"] in ['Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection']:
+                if row["action"] == 'Establishment re-opened by DOHMH.':
+                    filtered = restaurant_inspection[(restaurant_inspection["permit_number"]==row["permit_number"])&(restaurant_inspection["action"].isin(["Establishment Closed by DOHMH. Violations were cited in the following area(s) and those requiring immediate action were addressed.","Establishment re-closed by DOHMH."]))].sort_values(by="inspection_date", ascending=False)
+                    inspections_when_closed = filtered.groupby(["permit_number","inspection_date"])["inspection_type"].agg(list).reset_index().sort_values(by=["permit_number","inspection_date"], ascending=[True, False])
+                    for index in range(len(inspections_when_closed)):
+                        inspection_list = inspections_when_closed.iloc[index,:]["inspection_type"]
+                        if 'Cycle Inspection / Initial Inspection' in inspection_list or 'Pre-permit (Operational) / Initial Inspection' in inspection_list:
+                            return 'P'
+                            break
+                        elif any("Compliance Inspection" in inspection for inspection in inspection_list):
+                            return 'C'
+                            break
+                        elif any("Reopening Inspection" in inspection for inspection in inspection_list):
+                            continue
+                else:
+                    return "N"
+
+        return row['grade']
+
+    df = restaurant_inspection
+    gradable_inspections = df[df["inspection_type"].isin(['Cycle Inspection / Initial Inspection','Pre-permit (Operational) / Initial Inspection',
+                                                          'Cycle Inspection / Re-inspection','Pre-permit (Operational) / Re-inspection',
+                                                          'Pre-permit (Operational) / Reopening Inspection','Cycle Inspection / Reopening Inspection'])]
+    gradable_inspections = gradable_inspections.sort_values(by=["permit_number","inspection_date"], ascending = [True, False]).drop_duplicates(subset="permit_number")
+    gradable_inspections["grade"] = gradable_inspections.apply(determine_grade, axis=1)
+    gradable_inspections.loc[gradable_inspections["action"]=="No violations were recorded at the time of this inspection.","grade"] = "A"
+    gradable_inspections.loc[gradable_inspections["grade"]=="N","grade"]="Not Yet Graded"
+    gradable_inspections.loc[gradable_inspections["grade"].isin(["Z","P"]),"grade"] = "Grade Pending"
+    return gradable_inspections
+
+# Each history is a list of (day, inspection_type, action, score, grade) for one permit, paired with the grade
+# its latest gradable inspection is expected to get.
+HISTORIES = {
+    "initial low score": ([(1, INITIAL, CITED, 10, None)], "A"),
+    "initial high score": ([(1, INITIAL, CITED, 20, None)], "Not Yet Graded"),
+    "initial no violations": ([(1, INITIAL, NO_VIOLATIONS, 0, None)], "A"),
+    "initial nan score": ([(1, INITIAL, CITED, np.nan, None)], None),
+    "re-inspection B": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, 20, None)], "B"),
+    "re-inspection C": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, 35, None)], "C"),
+    "re-inspection nan score": ([(1, INITIAL, CITED, 20, None), (30, RE_INSPECTION, CITED, np.nan, None)], None),
+    "regraded N to A": ([(1, RE_INSPECTION, CITED, 12, "N")], "A"),
+    "regraded N to B": ([(1, RE_INSPECTION, CITED, 20, "N")], "B"),
+    "regraded N to C": ([(1, RE_INSPECTION, CITED, 40, "N")], "C"),
+    "regraded N while closed": ([(1, RE_INSPECTION, CLOSED, 40, "N")], "Not Yet Graded"),
+    "regraded N nan score": ([(1, RE_INSPECTION, CITED, np.nan, "N")], "Not Yet Graded"),
+    "closed on initial": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, REOPENED, 5, None)], "Grade Pending"),
+    "closed on initial, graded reopening": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, REOPENED, 5, "A")], "Grade Pending"),
+    "closed on re-inspection B": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 20, None), (25, REOPENING, REOPENED, 5, None)], "B"),
+    "closed on re-inspection C": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 30, None), (25, REOPENING, REOPENED, 5, None)], "C"),
+    "closed on low re-inspection": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 10, None), (25, REOPENING, REOPENED, 5, None)], None),
+    "closed on graded re-inspection": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 30, "B"), (25, REOPENING, REOPENED, 5, None)], "B"),
+    "closed on re-inspection, graded reopening": ([(1, INITIAL, CITED, 20, None), (20, RE_INSPECTION, CLOSED, 30, None), (25, REOPENING, REOPENED, 5, "Z")], "Grade Pending"),
+    "closed on compliance": ([(1, INITIAL, CLOSED, 40, None), (5, COMPLIANCE, RECLOSED, 30, None), (9, REOPENING, REOPENED, 5, None)], "C"),
+    "closed on compliance, graded reopening": ([(1, INITIAL, CLOSED, 40, None), (5, COMPLIANCE, RECLOSED, 30, None), (9, REOPENING, REOPENED, 5, "P")], "C"),
+    "re-closed on reopening then initial": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, RECLOSED, 20, None), (9, REOPENING, REOPENED, 5, None)], "Grade Pending"),
+    "initial and re-inspection closed same day": ([(1, INITIAL, CLOSED, 40, None), (1, RE_INSPECTION, CLOSED, 30, None), (5, REOPENING, REOPENED, 5, None)], "Grade Pending"),
+    "older closure ignored": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, REOPENED, 5, "P"), (100, INITIAL, CITED, 20, None),
+                               (120, RE_INSPECTION, CLOSED, 30, None), (125, REOPENING, REOPENED, 5, None)], "C"),
+    "reopening still closed": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, RECLOSED, 20, None)], "Not Yet Graded"),
+    "graded reopening still closed": ([(1, INITIAL, CLOSED, 40, None), (5, REOPENING, RECLOSED, 20, "A")], "Not Yet Graded"),
+    "reopening without closure": ([(5, REOPENING, REOPENED, 5, None)], None),
+}
+
+
+def history_frame(histories):
+    rows = []
+    for permit, history in enumerate(histories, start=40000001):
+        for day, inspection_type, action, score, grade in history:
+            rows.append({"permit_number": permit, "inspection_date": pd.Timestamp("2023-01-01") + pd.Timedelta(days=day), "inspection_type": inspection_type,
+                         "action": action, "score": score, "grade": grade})
+    return pd.DataFrame(rows)
+
+def grades(df):
+    return df.set_index("permit_number")["grade"].astype(object).where(lambda grade: grade.notna(), None).sort_index()
+
+@pytest.mark.parametrize("name", list(HISTORIES))
+def test_history(name):
+    history, expected = HISTORIES[name]
+    df = history_frame([history])
+    assert grades(gradable_inspection(df)).iloc[0] == expected
+    assert grades(legacy_gradable_inspection(df)).iloc[0] == expected
+
+def test_fixture_histories_together():
+    df = history_frame([history for history, _ in HISTORIES.values()])
+    pd.testing.assert_series_equal(grades(gradable_inspection(df)), grades(legacy_gradable_inspection(df)))
+
+@pytest.mark.parametrize("seed", range(3))
+def test_synthetic_histories(seed):
+    df = clean_inspections(pd.DataFrame(synthetic_page(0, 3000, seed)), report_memory=False)
+    legacy = df.astype({"inspection_type": object, "action": object, "score": float})
+    pd.testing.assert_series_equal(grades(gradable_inspection(df)), grades(legacy_gradable_inspection(legacy)))
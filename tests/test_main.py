@@ -0,0 +1,56 @@
+import os
+import pandas as pd
+import pytest
+from geopy.extra.rate_limiter import RateLimiter
+import geocoding
+from benchmark import StubGeocoder
+from data_update import main
+from profiling import CALL_COUNTS
+from test_restaurant_data import raw_rows, fake_pages
+
+STAGE_FUNCTIONS = ["restaurant_data", "restaurant_table", "replace_lat_lon", "gradable_inspection", "score_grade_audit", "finalize_restaurant"]
+
+
+def inspections():
+    # Permit 2 has no coordinates, so the geocode stage has an address to resolve.
+    frame = raw_rows([(1, "2024-02-01", "02B"), (1, "2024-02-01", "04L"), (2, "2024-02-10", "08A")])
+    frame.loc[frame["camis"] == "2", ["latitude", "longitude"]] = None
+    return frame
+
+def run(argv):
+    before = CALL_COUNTS.copy()
+    main(argv)
+    return {name: CALL_COUNTS[name] - before[name] for name in STAGE_FUNCTIONS}
+
+@pytest.fixture
+def workdir(monkeypatch, tmp_path):
+    # The snapshot, checkpoint and geocode cache paths are relative to the working directory.
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(geocoding, "ArcGIS", lambda timeout: StubGeocoder())
+    monkeypatch.setattr(RateLimiter, "_sleep", lambda self, seconds: None)
+    fake_pages(monkeypatch, inspections())
+    return tmp_path
+
+def test_stages_rerun_only_when_inputs_change(workdir, monkeypatch):
+    argv = ["--sink", "parquet:out", "--artifact-dir", "artifacts"]
+    assert run(argv) == dict.fromkeys(STAGE_FUNCTIONS, 1)
+    published = pd.read_parquet(workdir / "out" / "restaurant").set_index("permit_number")
+    assert published["latitude"].notna().all()
+
+    # The second run reads back the published state, which fills in permit 2's geocoded coordinates, so clean and
+    # geocode rebuild; their output is unchanged, so normalize does not.
+    assert run(argv) == {**dict.fromkeys(STAGE_FUNCTIONS, 0), "restaurant_data": 1, "restaurant_table": 1, "replace_lat_lon": 1}
+    # The same download and state again: only the fetch runs, every later stage reuses its artifact.
+    assert run(argv) == {**dict.fromkeys(STAGE_FUNCTIONS, 0), "restaurant_data": 1}
+
+    # Upstream changed, but --from-cache neither downloads nor rebuilds anything.
+    fake_pages(monkeypatch, raw_rows([(3, "2024-02-20", "10F")], "2024-03-02"))
+    assert run(argv + ["--from-cache"]) == dict.fromkeys(STAGE_FUNCTIONS, 0)
+
+    # --only rebuilds the one stage from the cached inspections.
+    assert run(argv + ["--only", "grade"]) == {**dict.fromkeys(STAGE_FUNCTIONS, 0), "gradable_inspection": 1}
+
+def test_only_without_cached_inputs_fails(workdir):
+    with pytest.raises(FileNotFoundError, match="inspections"):
+        main(["--sink", "parquet:out", "--artifact-dir", "artifacts", "--only", "grade"])
+    assert not os.path.exists(workdir / "out")
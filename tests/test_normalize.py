@@ -0,0 +1,77 @@
+import pytest
+from normalize import street_name, title_case
+
+# Expected outputs of the street and name normalizers on spellings as they appear in the inspection dataset. Any
+# change here changes what is published, so update an entry only on purpose.
+STREETS = [
+    ('BROADWAY', 'Broadway'),
+    ('WEST 4 STREET', 'W 4th St'),
+    ('EAST 23RD ST', 'E 23rd St'),
+    ('5 AVENUE', '5th Ave'),
+    ('FLATBUSH AVENUE', 'Flatbush Ave'),
+    ('QUEENS BOULEVARD', 'Queens Blvd'),
+    ('GRAND CONCOURSE', 'Grand Concourse'),
+    ('ST NICHOLAS AVENUE', 'St Nicholas Ave'),
+    ('SAINT MARKS PLACE', 'St Marks Pl'),
+    ('ST. MARKS PLACE', 'St. Marks Pl'),
+    ('FORT HAMILTON PARKWAY', 'Fort Hamilton Pkwy'),
+    ('HYLAN BOULEVARD', 'Hylan Blvd'),
+    ("B'WAY", 'Broadway'),
+    ('1 AVENUE', '1st Ave'),
+    ('2 AVENUE', '2nd Ave'),
+    ('3 AVENUE', '3rd Ave'),
+    ('11 AVENUE', '11th Ave'),
+    ('12 AVENUE', '12th Ave'),
+    ('13 AVENUE', '13th Ave'),
+    ('21 STREET', '21st St'),
+    ('22 STREET', '22nd St'),
+    ('112 STREET', '112th St'),
+    ('WEST 111TH STREET', 'W 111th St'),
+    ('JFK INTAIRP', 'John F. Kennedy International Airport'),
+    ('JFK INTAIRP ARVL BLDG', 'John F. Kennedy International Airport Arrival Building'),
+    ('ROCKEFELLER CTR', 'Rockefeller Center'),
+    ('GRAND ARMY PLZ', 'Grand Army Plaza'),
+    ('UNION SQUARE', 'Union Sq'),
+    ('HUDSON TERRACE', 'Hudson Ter'),
+    ('RIVERSIDE DRIVE', 'Riverside Dr'),
+    ('BRUCKNER EXPRESSWAY', 'Bruckner Expy'),
+    ('KINGS HIGHWAY', 'Kings Hwy'),
+    ('WYCKOFF AVENUE', 'Wyck Ave'),
+    ('JACKIE ROBINSON PKWY', 'Jackie Robinson Pkwy'),
+    ('UNION TURNPIKE', 'Union Tpke'),
+    ('79 STREET TRAVERSE', '79th St Transverse'),
+    ('MAIDEN LANE', 'Maiden Ln'),
+    ('ATLANTIC AVENUE,', 'Atlantic Ave,'),
+    ('STREET,', 'St,'),
+    ('OCEAN PKWY (SERVICE RD)', 'Ocean Pkwy (Service Rd)'),
+    ('A-1 AVENUE', 'A-1 Ave'),
+    ("O'BRIEN PLACE", "O'BRIEN Pl"),
+    ('  WEST   4  STREET ', 'W 4th St'),
+    ('PARK ROW', 'Park Row'),
+]
+
+NAMES = [
+    ("JOE'S PIZZA", "Joe's Pizza"),
+    ("MCDONALD'S", "Mcdonald's"),
+    ('2 BROS PIZZA', '2 Bros Pizza'),
+    ('THE HALAL GUYS', 'The Halal Guys'),
+    ("KATZ'S DELICATESSEN", "Katz's Delicatessen"),
+    ('99 CENT FRESH PIZZA', '99 Cent Fresh Pizza'),
+    ("P.J. CLARKE'S", "P.j. Clarke's"),
+    ('BURGER & LOBSTER', 'Burger & Lobster'),
+    ('(LE) PAIN QUOTIDIEN', '(le) Pain Quotidien'),
+    ('1 OAK', '1 Oak'),
+    ('EL BASURERO  ', 'El Basurero'),
+    ("DUNKIN'", "Dunkin'"),
+    ('7-ELEVEN', '7-eleven'),
+    ("'21' CLUB", "'21' Club"),
+]
+
+
+@pytest.mark.parametrize("street, expected", STREETS)
+def test_street_name(street, expected):
+    assert street_name(street) == expected
+
+@pytest.mark.parametrize("name, expected", NAMES)
+def test_title_case(name, expected):
+    assert title_case(name) == expected
@@ -0,0 +1,76 @@
+import json
+import threading
+import urllib.parse
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pandas as pd
+import pytest
+import requests
+from data_update import odata_pages
+
+ROWS = 95
+PAGE_SIZE = 10
+
+
+def serve(failures, report_count=True):
+    # OData stand-in paging ROWS rows by $skip. failures maps a skip to the statuses returned before it succeeds.
+    served = Counter()
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = dict(urllib.parse.parse_qsl(urllib.parse.urlparse(self.path).query))
+            skip = int(query.get("$skip", 0))
+            if failures.get(skip):
+                self.send_response(failures[skip].pop(0))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            served[skip] += 1
+            body = {"value": [{"__id": f"row-{i:03d}", "value": i} for i in range(skip, min(skip + PAGE_SIZE, ROWS))]}
+            if report_count and query.get("$count") == "true":
+                body["@odata.count"] = ROWS
+            if skip + PAGE_SIZE < ROWS:
+                body["@odata.nextLink"] = f"http://127.0.0.1:{server.server_port}/?$skip={skip + PAGE_SIZE}"
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/", served
+
+def crawl(url, checkpoint_dir, workers=4):
+    return pd.concat(list(odata_pages(url, workers=workers, checkpoint_dir=str(checkpoint_dir))), ignore_index=True)
+
+def test_serial_nextlink_crawl(tmp_path):
+    server, url, served = serve({}, report_count=False)
+    pages = crawl(url, tmp_path / "pages")
+    server.shutdown()
+    server.server_close()
+    assert pages["value"].tolist() == list(range(ROWS))
+    assert all(count == 1 for count in served.values())
+
+def test_resume_after_failure_fetches_each_page_once(tmp_path):
+    server, url, _ = serve({}, report_count=False)
+    serial = crawl(url, tmp_path / "serial")
+    server.shutdown()
+    server.server_close()
+
+    # skip 20 fails transiently and is retried by the session; skip 50 fails hard and aborts the first crawl.
+    server, url, served = serve({20: [503], 50: [404]})
+    with pytest.raises(requests.HTTPError):
+        crawl(url, tmp_path / "pages")
+    assert (tmp_path / "pages" / "manifest.json").exists()
+    resumed = crawl(url, tmp_path / "pages")
+    server.shutdown()
+    server.server_close()
+
+    pd.testing.assert_frame_equal(resumed, serial)
+    assert served[0] == 2
+    assert all(served[skip] == 1 for skip in range(PAGE_SIZE, ROWS, PAGE_SIZE))
@@ -0,0 +1,73 @@
+import json
+import pandas as pd
+import pyarrow.parquet as pq
+import data_update
+from benchmark import synthetic_page, serve_pages
+from data_update import restaurant_data, stream_restaurant_data, grade_table, score_grade_audit, restaurant_table, RESTAURANT_COLUMNS
+
+
+def raw_rows(rows, record_date="2024-03-01"):
+    return pd.DataFrame([{"__id": f"row-{i}", "location_point1": None, "camis": str(permit), "dba": "JOE'S PIZZA", "boro": "Manhattan",
+                          "building": "1", "street": "BROADWAY", "zipcode": "10001", "phone": "2125550000", "cuisine_description": "Pizza",
+                          "latitude": 40.7, "longitude": -74.0, "inspection_date": f"{date}T00:00:00.000", "action": "Violations were cited in the following area(s).",
+                          "violation_code": code, "violation_description": "Description", "critical_flag": "Critical", "score": 10, "grade": "A",
+                          "grade_date": f"{date}T00:00:00.000", "record_date": f"{record_date}T00:00:00.000", "inspection_type": "Cycle Inspection / Initial Inspection"}
+                         for i, (permit, date, code) in enumerate(rows)])
+
+def fake_pages(monkeypatch, frame):
+    calls = []
+
+    def odata_pages(url, params=None, workers=8, checkpoint_dir=None):
+        calls.append(params)
+        yield frame
+    monkeypatch.setattr(data_update, "odata_pages", odata_pages)
+    return calls
+
+def violations(df):
+    return sorted(zip(df["permit_number"], df["inspection_date"].dt.strftime("%Y-%m-%d"), df["violation_code"]))
+
+def test_delta_replaces_inspection_groups_and_overlap(monkeypatch, tmp_path):
+    snapshot_path = str(tmp_path / "snapshot.parquet")
+    fake_pages(monkeypatch, raw_rows([(1, "2023-06-01", "02B"), (1, "2023-06-01", "04L"), (2, "2023-06-01", "08A"),
+                                      (3, "2024-02-20", "02G"), (4, "2024-02-25", "10F")]))
+    restaurant_data(snapshot_path=snapshot_path, checkpoint_dir=str(tmp_path / "pages"), full_refresh=True)
+
+    # Permit 1's old inspection was corrected to a single code, permit 3 disappeared upstream inside the overlap
+    # window and permit 5 is new.
+    calls = fake_pages(monkeypatch, raw_rows([(1, "2023-06-01", "02G"), (4, "2024-02-25", "10F"), (5, "2024-02-28", "04N")], "2024-03-02"))
+    merged = restaurant_data(snapshot_path=snapshot_path, checkpoint_dir=str(tmp_path / "pages"))
+    assert calls[0] == {"$filter": "inspection_date ge 2024-01-26T00:00:00Z or record_date gt 2024-03-01T00:00:00Z"}
+    assert violations(merged) == [(1, "2023-06-01", "02G"), (2, "2023-06-01", "08A"), (4, "2024-02-25", "10F"), (5, "2024-02-28", "04N")]
+
+def test_stale_full_refresh_downloads_everything(monkeypatch, tmp_path):
+    snapshot_path = str(tmp_path / "snapshot.parquet")
+    fake_pages(monkeypatch, raw_rows([(1, "2023-06-01", "02B"), (2, "2023-06-01", "08A")]))
+    restaurant_data(snapshot_path=snapshot_path, checkpoint_dir=str(tmp_path / "pages"), full_refresh=True)
+    with open(tmp_path / "snapshot.json", "w") as f:
+        json.dump({"full_refresh": (pd.Timestamp.now() - pd.Timedelta(days=8)).isoformat()}, f)
+
+    calls = fake_pages(monkeypatch, raw_rows([(2, "2023-06-01", "08A")]))
+    refreshed = restaurant_data(snapshot_path=snapshot_path, checkpoint_dir=str(tmp_path / "pages"))
+    assert calls == [None]
+    assert violations(refreshed) == [(2, "2023-06-01", "08A")]
+
+def test_stream_matches_full_download(tmp_path):
+    # Rows are shuffled across pages, as the real dataset is ordered by __id, so a permit's history is split over
+    # several pages and several consolidations.
+    rows = pd.DataFrame(synthetic_page(0, 6000, 0)).sample(frac=1, random_state=0).to_dict(orient="records")
+    for index in range(0, len(rows), 400):
+        with open(tmp_path / f"page_{index // 400}.json", "w") as f:
+            json.dump(rows[index:index+400], f)
+    server, url = serve_pages(str(tmp_path), len(rows), 400)
+    full = restaurant_data(url, 4, str(tmp_path / "full_pages"), str(tmp_path / "full.parquet"), full_refresh=True)
+    streamed = stream_restaurant_data(url, 4, str(tmp_path / "stream_pages"), str(tmp_path / "stream.parquet"), consolidate_every=3)
+    server.shutdown()
+    server.server_close()
+
+    assert len(streamed) < len(full)
+    pd.testing.assert_frame_equal(grade_table(streamed).sort_values("permit_number", ignore_index=True),
+                                  grade_table(full).sort_values("permit_number", ignore_index=True))
+    pd.testing.assert_frame_equal(score_grade_audit(streamed), score_grade_audit(full))
+    restaurants = [restaurant_table(df).sort_values(RESTAURANT_COLUMNS, ignore_index=True) for df in [streamed, full]]
+    pd.testing.assert_frame_equal(*restaurants)
+    assert pq.ParquetFile(tmp_path / "stream.parquet").metadata.num_rows == pq.ParquetFile(tmp_path / "full.parquet").metadata.num_rows == len(rows)
@@ -0,0 +1,75 @@
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from sheets_publisher import publish_frame, sheet_cells, FakeWorksheet
+
+
+def frame(permits, version=0):
+    return pd.DataFrame({"permit_number": permits, "name": [f"Restaurant {permit} v{version}" for permit in permits]})
+
+def sheet_matches(worksheet, df):
+    # Rows keep their slots across diffs, so the sheet holds the frame's rows in any order below the header.
+    cells = sheet_cells(df)
+    values = worksheet.get_all_values()
+    return values[0] == list(cells.columns) and sorted(values[1:]) == sorted(cells.to_numpy().tolist())
+
+class FailingWorksheet(FakeWorksheet):
+    def __init__(self, *args, fail_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_after = fail_after
+
+    def update_values_batch(self, ranges, values):
+        if self.fail_after is not None:
+            if self.fail_after == 0:
+                raise RuntimeError("quota exceeded")
+            self.fail_after -= 1
+        super().update_values_batch(ranges, values)
+
+def test_stale_snapshot_falls_back_to_full_write(tmp_path):
+    worksheet = FakeWorksheet("restaurant")
+    snapshot_path = str(tmp_path / "restaurant.parquet")
+    publish_frame(worksheet, frame([1, 2, 3]), ["permit_number"], snapshot_path)
+    shutil.copy(snapshot_path, tmp_path / "old.parquet")
+    publish_frame(worksheet, frame([3, 4, 5], 1), ["permit_number"], snapshot_path)
+
+    # The snapshot is restored from an older cache while the sheet kept the newer rows. Diffing against it would
+    # find nothing to write.
+    shutil.copy(tmp_path / "old.parquet", snapshot_path)
+    assert publish_frame(worksheet, frame([1, 2, 3]), ["permit_number"], snapshot_path) == 3
+    assert sheet_matches(worksheet, frame([1, 2, 3]))
+
+def test_failed_publish_is_rewritten_in_full(tmp_path):
+    worksheet = FailingWorksheet("restaurant")
+    snapshot_path = str(tmp_path / "restaurant.parquet")
+    publish_frame(worksheet, frame(range(10)), ["permit_number"], snapshot_path)
+
+    worksheet.fail_after = 1
+    with pytest.raises(RuntimeError):
+        publish_frame(worksheet, frame(range(10), 1), ["permit_number"], snapshot_path, max_cells=8)
+    # The first rows of the failed run reached the sheet but the snapshot still describes the earlier frame.
+    worksheet.fail_after = None
+    assert publish_frame(worksheet, frame(range(10)), ["permit_number"], snapshot_path) == 10
+    assert sheet_matches(worksheet, frame(range(10)))
+
+def mutate(rng, df, version):
+    # Random deletes, inserts (including duplicate keys) and in-place changes, with the rows shuffled.
+    df = df.drop(index=rng.choice(df.index, size=rng.integers(0, len(df) // 3 + 1), replace=False))
+    inserted = rng.integers(0, 60, size=rng.integers(0, 8))
+    df = pd.concat([df, frame(inserted, version)], ignore_index=True)
+    changed = rng.random(len(df)) < 0.2
+    df.loc[changed, "name"] = [f"Changed {version}-{index}" for index in range(changed.sum())]
+    return df.sample(frac=1, random_state=int(rng.integers(1 << 31))).reset_index(drop=True)
+
+@pytest.mark.parametrize("seed", range(40))
+def test_random_edit_sequences(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    worksheet = FakeWorksheet("restaurant", rows=int(rng.integers(1, 50)))
+    snapshot_path = str(tmp_path / "restaurant.parquet")
+    df = frame(rng.integers(0, 60, size=rng.integers(0, 30)))
+    for version in range(6):
+        publish_frame(worksheet, df, ["permit_number"], snapshot_path, max_cells=int(rng.integers(2, 40)))
+        assert sheet_matches(worksheet, df)
+        assert publish_frame(worksheet, df, ["permit_number"], snapshot_path) == 0
+        assert sheet_matches(worksheet, df)
+        df = mutate(rng, df, version)
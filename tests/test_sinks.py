@@ -0,0 +1,52 @@
+import sqlite3
+from contextlib import closing
+import numpy as np
+import pandas as pd
+import pytest
+from sinks import ParquetSink, SQLiteSink, GeoJSONSink
+from data_update import restaurant_table
+
+
+def restaurant(boroughs):
+    return pd.DataFrame({"permit_number": range(1, len(boroughs) + 1), "restaurant_name": "Joe's Pizza", "borough": boroughs,
+                         "street": "Broadway", "zipcode": "10001", "latitude": 40.7, "longitude": -74.0, "phone": "2125550000",
+                         "cuisine_description": "Pizza", "grade": "A", "address": "1 Broadway", "img_src": ""})
+
+def violation():
+    return pd.DataFrame({"permit_number": [1], "inspection_date": pd.to_datetime(["2024-01-01"]), "violation_code": ["02B"]})
+
+def test_parquet_sink_keeps_missing_borough(tmp_path):
+    sink = ParquetSink(str(tmp_path / "parquet"))
+    sink.write(restaurant(["Manhattan", np.nan]), [violation()])
+    previous = sink.read_restaurant().sort_values("permit_number")
+    assert previous["borough"].tolist()[0] == "Manhattan"
+    assert pd.isna(previous["borough"].tolist()[1])
+
+    # Used as the state source, the sink must not backfill a missing borough with the partition placeholder.
+    inspections = restaurant(["Manhattan", np.nan]).assign(building="1").drop(columns=["grade", "address", "img_src"])
+    assert pd.isna(restaurant_table(inspections, previous).set_index("permit_number").loc[2, "borough"])
+
+def test_file_sinks_write_violation_chunks(tmp_path):
+    chunks = [violation(), violation().assign(permit_number=2, inspection_date=pd.to_datetime(["2023-05-01"]))]
+    parquet_sink, sqlite_sink = ParquetSink(str(tmp_path / "parquet")), SQLiteSink(str(tmp_path / "restaurants.sqlite"))
+    for sink in [parquet_sink, sqlite_sink]:
+        sink.write(restaurant(["Manhattan", "Queens"]), iter(chunks))
+    assert sorted(pd.read_parquet(tmp_path / "parquet" / "violation")["permit_number"]) == [1, 2]
+    with closing(sqlite3.connect(tmp_path / "restaurants.sqlite")) as connection:
+        assert pd.read_sql("SELECT permit_number FROM violation ORDER BY permit_number", connection)["permit_number"].tolist() == [1, 2]
+
+@pytest.mark.parametrize("make_sink", [lambda tmp_path: SQLiteSink(str(tmp_path / "restaurants.sqlite")),
+                                       lambda tmp_path: GeoJSONSink(str(tmp_path / "restaurants.geojson"))], ids=["sqlite", "geojson"])
+def test_file_sink_state_round_trip(tmp_path, make_sink):
+    sink = make_sink(tmp_path)
+    assert sink.read_restaurant() is None
+    sink.write(restaurant(["Manhattan", np.nan]).assign(latitude=[40.7, 40.75], longitude=[-74.0, -73.95]), [violation()])
+    previous = sink.read_restaurant()
+
+    # This run lost permit 2's coordinates, which the previous state fills back in; its missing borough stays missing.
+    inspections = restaurant(["Manhattan", np.nan]).assign(building="1", latitude=[40.7, np.nan], longitude=[-74.0, np.nan])
+    restored = restaurant_table(inspections.drop(columns=["grade", "address", "img_src"]), previous).set_index("permit_number")
+    assert restored.loc[2, ["latitude", "longitude"]].tolist() == [40.75, -73.95]
+    assert restored.loc[1, "borough"] == "Manhattan"
+    assert pd.isna(restored.loc[2, "borough"])
+    assert restored.loc[2, "zipcode"] == "10001"